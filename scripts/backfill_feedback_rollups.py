@@ -0,0 +1,37 @@
+import sys
+from pathlib import Path
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Add the project root to the Python path
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from src.db_schema import Base
+from src.feedback_rollups import rebuild_rollups
+
+def main():
+    # Setup database connection
+    db_path = project_root / 'mental_health_kb.db'
+    engine = create_engine(f'sqlite:///{db_path}')
+
+    # Create the rollup tables if this database predates them
+    Base.metadata.create_all(engine)
+
+    Session = sessionmaker(bind=engine)
+    session = Session()
+
+    try:
+        print("Rebuilding feedback rollups from the feedback table...")
+        scanned = rebuild_rollups(session)
+        session.commit()
+        print(f"Feedback rollups rebuilt from {scanned} feedback rows.")
+    except Exception as e:
+        session.rollback()
+        print(f"Error rebuilding feedback rollups: {e}")
+        raise
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    main()
@@ -11,9 +11,10 @@ sys.path.append(str(project_root))
 
 from src.db_schema import (
     Base, Problem, SelfAssessment, Suggestion, 
-    FeedbackPrompt, NextAction, FinetuningExample, Feedback
+    FeedbackPrompt, NextAction, FinetuningExample, Feedback, FeedbackScoringJob
 )
 from src.data_loader import DataLoader
+from src.feedback_rollups import ROLLUP_MODELS
 
 def dataclass_to_dict_list(dataclass_list):
     """Convert a list of dataclass instances to a list of dictionaries"""
@@ -37,7 +38,10 @@ def main():
     try:
         # Clear existing data in the correct order to respect foreign key constraints
         print("Clearing existing data...")
+        session.query(FeedbackScoringJob).delete()
         session.query(Feedback).delete()
+        for rollup_model in ROLLUP_MODELS:
+            session.query(rollup_model).delete()
         session.query(FinetuningExample).delete()
         session.query(FeedbackPrompt).delete()
         session.query(SelfAssessment).delete()
@@ -0,0 +1,125 @@
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; maps to an HTTP error with Retry-After"""
+
+    def __init__(self, name: str, reason: str, status_code: int, retry_after: int):
+        super().__init__(f"{name} is overloaded ({reason})")
+        self.name = name
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded FIFO wait queue.
+
+    Up to ``max_concurrency`` requests run at once. Up to ``max_queue`` more
+    wait in arrival order for at most ``queue_timeout`` seconds. Anything
+    beyond that is rejected immediately, so overload turns into fast errors
+    instead of an ever-growing backlog. Must be used from a single event loop.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        max_queue: int,
+        queue_timeout: float,
+        retry_after: int = 1,
+        status_code: int = 503
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.rejected = {'queue_full': 0, 'timeout': 0}
+        self._queued = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        self.rejected[reason] += 1
+        return AdmissionRejected(self.name, reason, self.status_code, self.retry_after)
+
+    def _record_wait(self, waited: float) -> None:
+        self.admitted += 1
+        self._queued += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+
+    async def acquire(self) -> None:
+        """Wait for a slot or raise AdmissionRejected"""
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject('queue_full')
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            # wait_for cancelled the waiter, so release() will skip it
+            self._discard(waiter)
+            raise self._reject('timeout')
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # A slot was handed over just before the caller went away
+                self.release()
+            else:
+                self._discard(waiter)
+            raise
+        self._record_wait(time.monotonic() - started)
+
+    def release(self) -> None:
+        """Free a slot, handing it directly to the oldest live waiter"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    def _discard(self, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    @asynccontextmanager
+    async def admit(self):
+        """Hold a slot for the duration of the block"""
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'active': self._active,
+            'queue_depth': len(self._waiters),
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'queue_timeout_seconds': self.queue_timeout,
+            'admitted': self.admitted,
+            'rejected': dict(self.rejected),
+            'queued': self._queued,
+            'avg_queue_wait_ms': 1000 * self._wait_total / self._queued if self._queued else 0.0,
+            'max_queue_wait_ms': 1000 * self._wait_max
+        }
@@ -1,22 +1,45 @@
 from dotenv import load_dotenv
 import os
+import re
 import json
+import time
 import uuid
+import hashlib
+import asyncio
+import functools
+import threading
+import contextvars
 from datetime import datetime
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Tuple, Iterator, AsyncIterator
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy import create_engine, or_
 from sqlalchemy.orm import sessionmaker
+from src.single_flight import SingleFlight
+from src.metrics import metrics
+from src.tracing import log
+from src.feedback_rollups import record_feedback
+from src.sentiment import estimate_sentiment
+from src.sentiment_scoring import SentimentScoringQueue
+from src.semantic_cache import SemanticResponseCache
+from src.response_cache import ResponseCache, response_cache_key
+from src.intent_router import IntentRouter, needs_personal_answer
+from src.hybrid_retrieval import BM25Index, reciprocal_rank_fusion
+from src.kb_cache import kb_cache
+from src.conversation_memory import TokenBudgetMemory, format_chat_history
+from src.embedding_cache import DEFAULT_CACHE_DIR, DEFAULT_EMBEDDING_MODEL, cached_huggingface_embeddings
 from src.db_schema import (
     Problem, SelfAssessment, Suggestion, 
-    FeedbackPrompt, NextAction, FinetuningExample, Feedback
+    FeedbackPrompt, NextAction, FinetuningExample, Feedback,
+    FeedbackScoringJob, configure_sqlite
 )
 
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
 from langchain_community.vectorstores import Chroma
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import HumanMessage, SystemMessage
+from langchain_core.documents import Document
+from langchain_core.messages import BaseMessage
+from langchain.prompts import PromptTemplate
 
 # Sentiment analysis prompt template
 SENTIMENT_ANALYSIS_PROMPT = """Analyze the sentiment of the following feedback text. 
@@ -29,33 +52,149 @@ Feedback: {feedback}
 
 JSON Response: """
 
+# Prompt used to rephrase a follow-up question into a standalone question
+CONDENSE_QUESTION_TEMPLATE = """Given the following conversation and a follow up question, rephrase the follow up question to be a standalone question, in its original language.
+        If you do not know the answer, just say that you do not know, do not try to make up an answer.
+        Provide a concise, empathetic, and helpful answer based on the chat history.
+        Do not directly quote any previous messages unless it's a definition or a specific instruction that needs to be precise.
+        Always respond in English.
+
+        Chat History:
+        {chat_history}
+        Follow Up Input: {question}
+        Standalone question:"""
+
+# Prompt used to fold turns that left the memory window into the rolling summary
+SUMMARY_TEMPLATE = """Progressively summarize the conversation between a user and a mental well-being assistant.
+Extend the current summary with the new lines, keeping what matters for answering later questions:
+the user's concerns, feelings and circumstances, and the advice already given. Use at most {max_words} words.
+
+Current summary:
+{summary}
+
+New lines:
+{new_lines}
+
+New summary:"""
+
+# More detailed prompt for the QA part
+QA_TEMPLATE = """
+You are a helpful and empathetic AI assistant for mental well-being. Your goal is to support users by providing information and guidance based on the context provided.
+Use the following pieces of context to answer the question at the end. If you don't know the answer from the context, politely say that you don't have specific information on that topic but can discuss general well-being.
+Do not make up information. Strive to be understanding and supportive in your responses. Always respond in English.
+
+Context:
+{context}
+
+Question: {question}
+
+Helpful Answer:"""
+
+CONDENSE_QUESTION_PROMPT = PromptTemplate.from_template(CONDENSE_QUESTION_TEMPLATE)
+QA_PROMPT = PromptTemplate(template=QA_TEMPLATE, input_variables=["context", "question"])
+
+def normalize_query(text: str) -> str:
+    """Normalize a user message for matching: case, whitespace and edge punctuation"""
+    return " ".join(text.lower().split()).strip(" .!?,;:")
+
+# Words that point back at earlier turns; a message using any of them needs the history
+CONTEXT_DEPENDENT_WORDS = frozenset({
+    'it', 'its', "it's", 'this', 'that', 'these', 'those', 'they', 'them', 'their', "they're",
+    'he', 'him', 'his', 'she', 'her', 'there', 'one', 'ones', 'same', 'such', 'other', 'another',
+    'else', 'more', 'also', 'too', 'again', 'above', 'previous', 'earlier', 'instead',
+    'former', 'latter', 'mentioned', 'said', 'suggested', 'example',
+    # Ordinals pick an item from an earlier answer ("the second suggestion")
+    'first', 'second', 'third', 'fourth', 'fifth', 'last', 'next', 'final',
+    # Bare questions and comparisons about the previous answer ("can you tell me why")
+    'why', 'different', 'differently', 'alternative', 'alternatives', 'similar', 'further',
+    'elaborate', 'continue'
+})
+# Words that ask for something without saying what; a message made only of
+# these ("could you give me some advice please") has no topic of its own
+REQUEST_WORDS = frozenset({
+    'a', 'an', 'the', 'i', 'me', 'my', 'you', 'your', 'we', 'us', 'can', 'could', 'would', 'will', 'should',
+    'do', 'does', 'did', 'is', 'are', 'was', 'be', 'to', 'of', 'for', 'on', 'in', 'with', 'about', 'please',
+    'what', 'how', 'when', 'where', 'which', 'who', 'tell', 'give', 'show', 'explain', 'say', 'help',
+    'some', 'any', 'thing', 'things', 'something', 'anything', 'way', 'ways', 'approach', 'idea', 'ideas',
+    'advice', 'tip', 'tips', 'option', 'options', 'suggestion', 'suggestions', 'know', 'want', 'need',
+    'mean', 'think', 'try', 'get', 'go', 'now', 'just', 'really', 'maybe', 'again', 'then', 'so'
+})
+# "the breathing exercise", "the tips": a definite reference to something
+# from an earlier answer, with up to two words in between
+DEFINITE_REFERENCE_PATTERN = re.compile(
+    r"\bthe (?:[a-z'-]+ ){0,2}?(suggestions?|steps?|exercises?|tips?|techniques?|strateg(y|ies)"
+    r"|ideas?|options?|advice|things?|list|links?|resources?|activit(y|ies)|methods?)\b"
+)
+# Openings that continue the previous turn
+FOLLOW_UP_OPENERS = ('and', 'but', 'so', 'or', 'then', 'ok', 'okay', 'yes', 'no', 'what about', 'how about', 'how come', 'what else')
+# Shorter messages ("why?", "any tips?") lean on the previous turn
+MIN_SELF_CONTAINED_WORDS = 5
+# Longest wait between retries of a failed keyword index build, in seconds
+KEYWORD_INDEX_MAX_BACKOFF = 300
+
+def is_self_contained(message: str) -> bool:
+    """Guess whether a follow-up message can be answered without the chat history.
+
+    Deliberately conservative: a wrong guess answers without any of the
+    conversation, since the QA prompt carries no history, while a missed one
+    only costs the condense LLM call. A message must name its own topic and
+    must not point back at earlier turns.
+    """
+    words = re.findall(r"[a-z']+", message.lower())
+    if len(words) < MIN_SELF_CONTAINED_WORDS:
+        return False
+    opening = " ".join(words[:2])
+    if any(opening == opener or opening.startswith(opener + " ") for opener in FOLLOW_UP_OPENERS):
+        return False
+    if DEFINITE_REFERENCE_PATTERN.search(" ".join(words)):
+        return False
+    if all(word in REQUEST_WORDS for word in words):
+        return False
+    return not any(word in CONTEXT_DEPENDENT_WORDS for word in words)
+
+def record_token_usage(message: Any, stage: str) -> None:
+    """Count the prompt and completion tokens reported on an LLM message"""
+    usage = getattr(message, 'usage_metadata', None)
+    if usage:
+        metrics.increment("llm_tokens_total", usage.get('input_tokens', 0), stage=stage, type="input")
+        metrics.increment("llm_tokens_total", usage.get('output_tokens', 0), stage=stage, type="output")
+
 load_dotenv()
 openai_api_key = os.getenv("OPENAI_API_KEY")
 
-class MentalHealthAIOrchestrator:
+class MentalHealthAIEngine:
+    """Process-wide heavy resources shared by every conversation.
+
+    Holds the DB engine, the embedding model, the vector store and the LLM
+    client. These are expensive to build, stateless with respect to a single
+    conversation and safe to share, so they are created once per config.
+    """
+
     def __init__(self, config: Dict[str, Any]):
         self.config = config
 
         # Initialize components
-        self.db_engine = create_engine(self.config['db_connection_string'])
+        self.db_engine = configure_sqlite(create_engine(self.config['db_connection_string']))
         self.Session = sessionmaker(bind=self.db_engine)
 
         # Initialize embeddings and vector database
         # For OpenAIEmbeddings, ensure OPENAI_API_KEY is set in your environment variables
-        # Use HuggingFaceEmbeddings with a model that produces 384 dimensions
-        from langchain_huggingface import HuggingFaceEmbeddings
-        
-        embedding_model_name = "all-MiniLM-L6-v2"
+        # Use HuggingFaceEmbeddings with a model that produces 384 dimensions,
+        # behind the query embedding cache shared with the vector DB build
+        embedding_model_name = DEFAULT_EMBEDDING_MODEL
         print(f"Attempting to initialize HuggingFaceEmbeddings with model: {embedding_model_name} on device: cpu")
         try:
             # Explicitly set device to 'cpu' to avoid meta tensor issues with sentence-transformers
-            self.embeddings = HuggingFaceEmbeddings(
-                model_name=embedding_model_name,
-                model_kwargs={'device': 'cpu'},
-                # encode_kwargs={'normalize_embeddings': True} # Optional: if you want normalized embeddings
+            self.embeddings = cached_huggingface_embeddings(
+                embedding_model_name,
+                cache_dir=self.config.get('embedding_cache_dir', DEFAULT_CACHE_DIR),
+                max_memory_entries=self.config.get('embedding_cache_memory_entries', 10000),
+                max_disk_entries=self.config.get('embedding_cache_disk_entries', 100000),
+                device='cpu'
             )
-            # Attempt a dummy embedding to ensure the model is loaded correctly
-            _ = self.embeddings.embed_query("Test query")
+            # Attempt a dummy embedding to ensure the model is loaded correctly;
+            # this goes to the model itself, not the cache
+            _ = self.embeddings.underlying.embed_query("Test query")
             print(f"HuggingFaceEmbeddings ({embedding_model_name}) initialized and tested successfully on CPU.")
         except Exception as e:
             print(f"CRITICAL ERROR: Failed to initialize or test HuggingFaceEmbeddings ({embedding_model_name}): {e}")
@@ -63,10 +202,8 @@ class MentalHealthAIOrchestrator:
             raise RuntimeError(f"Failed to initialize required embedding model ({embedding_model_name}). Application cannot proceed.") from e
 
         # Initialize LLM
-        self.llm = ChatOpenAI(temperature=0.7, model_name=self.config['model_name'], openai_api_key=openai_api_key)
-
-        # Initialize conversation memory
-        self.memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+        # stream_usage makes streamed responses report token counts too
+        self.llm = ChatOpenAI(temperature=0.7, model_name=self.config['model_name'], openai_api_key=openai_api_key, stream_usage=True)
 
         # Load existing vector database from the configured path
         try:
@@ -86,115 +223,255 @@ class MentalHealthAIOrchestrator:
             texts = text_splitter.split_text("No documents loaded for vector database. The AI will rely on its general knowledge.")
             self.vector_db = Chroma.from_texts(texts, self.embeddings)
 
+        # Coalesces identical first-turn questions that are in flight at the same time
+        self.single_flight = SingleFlight()
 
-        # Initialize retrieval chain with explicit configuration to return source documents
-        # Configure memory with explicit output key to avoid ValueError
-        self.memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True, output_key="answer")
+        # Number of documents retrieved per question
+        self.retrieval_k = self.config.get('retrieval_k', 5)
+        # Dense results are fused with BM25 keyword results over the same
+        # documents; each side contributes retrieval_k * hybrid_candidates candidates
+        self.hybrid_retrieval = self.config.get('hybrid_retrieval', True)
+        self.hybrid_candidates = self.config.get('hybrid_candidates', 4)
+        # The index follows the Chroma collection itself (it is rebuilt with new
+        # IDs independently of the SQL KB), checked every keyword_index_check_seconds
+        self.keyword_index_check_seconds = self.config.get('keyword_index_check_seconds', 30)
+        self._keyword_index: Optional[BM25Index] = None
+        self._keyword_index_fingerprint: Optional[str] = None
+        self._keyword_index_next_check = 0.0
+        self._keyword_index_failures = 0
+        self._keyword_index_lock = threading.Lock()
 
-        # Define a custom prompt for the document combination part of the chain
-        from langchain.prompts import PromptTemplate
-        _template = """Given the following conversation and a follow up question, rephrase the follow up question to be a standalone question, in its original language.
-        If you do not know the answer, just say that you do not know, do not try to make up an answer.
-        Provide a concise, empathetic, and helpful answer based on the chat history.
-        Do not directly quote any previous messages unless it's a definition or a specific instruction that needs to be precise.
-        Always respond in English.
+        # Query embedding is CPU-bound, so async callers run it on a small
+        # dedicated pool instead of the event loop or the default executor.
+        self.embedding_executor = ThreadPoolExecutor(
+            max_workers=self.config.get('embedding_workers', 2),
+            thread_name_prefix="embedding"
+        )
 
-        Chat History:
-        {chat_history}
-        Follow Up Input: {question}
-        Standalone question:"""
-        CONDENSE_QUESTION_PROMPT = PromptTemplate.from_template(_template)
+        # Rolling summaries of conversation history are written off the request path
+        self.summary_executor = ThreadPoolExecutor(
+            max_workers=self.config.get('memory_summary_workers', 2),
+            thread_name_prefix="memory-summary"
+        )
 
-        # More detailed prompt for the QA part
-        qa_template = """
-You are a helpful and empathetic AI assistant for mental well-being. Your goal is to support users by providing information and guidance based on the context provided.
-Use the following pieces of context to answer the question at the end. If you don't know the answer from the context, politely say that you don't have specific information on that topic but can discuss general well-being.
-Do not make up information. Strive to be understanding and supportive in your responses. Always respond in English.
+        # Authoritative LLM sentiment scoring of stored feedback, off the request path
+        self.sentiment_scorer = SentimentScoringQueue(self.Session, self.analyze_sentiment)
 
-Context:
-{context}
+        # Answers to history-free questions, reused for paraphrases of the same question
+        self.semantic_cache = SemanticResponseCache(
+            threshold=self.config.get('semantic_cache_threshold', 0.92),
+            ttl_seconds=self.config.get('semantic_cache_ttl_seconds', 3600),
+            max_entries=self.config.get('semantic_cache_max_entries', 1000)
+        )
+        # Exact-match answers to history-free questions, persisted in the DB and shared by all workers
+        self.response_cache = ResponseCache(
+            self.Session,
+            ttl_seconds=self.config.get('response_cache_ttl_seconds', 86400),
+            max_entries=self.config.get('response_cache_max_entries', 10000)
+        )
+        # Templated answers to structured KB questions, served from the DB without the LLM
+        self.intent_router = IntentRouter(self.Session)
+        print("Shared AI engine initialized")
 
-Question: {question}
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query string"""
+        with metrics.timer("rag_embedding_seconds"):
+            return self.embeddings.embed_query(text)
 
-Helpful Answer:"""
-        QA_PROMPT = PromptTemplate(template=qa_template, input_variables=["context", "question"])
-
-        self.retrieval_chain = ConversationalRetrievalChain.from_llm(
-            llm=self.llm,
-            retriever=self.vector_db.as_retriever(search_kwargs={"k": 5}),
-            memory=self.memory,
-            return_source_documents=True,
-            verbose=True,
-            condense_question_prompt=CONDENSE_QUESTION_PROMPT, # Added to rephrase the follow-up question
-            combine_docs_chain_kwargs={"prompt": QA_PROMPT} # This prompt guides the LLM on how to use the documents
-        )
+    async def _run_on_embedding_executor(self, func, *args):
+        # run_in_executor does not carry context variables over like
+        # asyncio.to_thread does, so pass the request's trace context explicitly
+        context = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.embedding_executor, functools.partial(context.run, func, *args))
 
-        print("AI components initialized with custom prompts")
+    async def aembed_query(self, text: str) -> List[float]:
+        """Embed a query string on the bounded embedding executor"""
+        return await self._run_on_embedding_executor(self.embed_query, text)
 
-    def get_problem_list(self) -> List[Dict[str, str]]:
-        """Get list of available mental health problems"""
-        session = self.Session()
-        problems = session.query(Problem).all()
-        session.close()
-        return [{'id': p.problem_id, 'name': p.problem_name} for p in problems]
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed many query strings in one batched encoder call"""
+        with metrics.timer("rag_embedding_seconds", batch="true"):
+            return self.embeddings.embed_documents(texts)
 
-    def get_self_assessment(self, problem_id: str) -> List[Dict[str, Any]]:
-        """Get self-assessment questions for a specific problem"""
-        session = self.Session()
-        questions = session.query(SelfAssessment).filter_by(problem_id=problem_id).all()
-        session.close()
-        return [{'id': q.question_id, 'text': q.question_text, 'type': q.response_type} for q in questions]
+    def _collection_fingerprint(self) -> str:
+        """Document count and ID hash of the vector store collection; a rebuild assigns new IDs"""
+        ids = self.vector_db.get(include=[])['ids']
+        digest = hashlib.blake2b(digest_size=16)
+        for doc_id in sorted(ids):
+            digest.update(doc_id.encode('utf-8') + b"\x00")
+        return f"{len(ids)}:{digest.hexdigest()}"
 
-    def get_suggestions(self, problem_id: str) -> List[Dict[str, Any]]:
-        """Get suggestions for a specific problem"""
-        session = self.Session()
-        suggestions = session.query(Suggestion).filter_by(problem_id=problem_id).all()
-        session.close()
-        return [{'id': s.suggestion_id, 'text': s.suggestion_text, 'resource': s.resource_link} for s in suggestions]
+    def keyword_index(self) -> Optional[BM25Index]:
+        """BM25 index over the vector store's documents, rebuilt when the collection changes.
 
-    def process_user_message(self, user_id: str, message: str) -> Dict[str, Any]:
-        """Process a user message and generate a response using RAG"""
-        # Add instruction to respond in English
-        english_prompt = f"Please respond in English. {message}"
-        
-        # Use the retrieval chain to get a response
-        response = self.retrieval_chain.invoke({"question": english_prompt})
-
-        # Extract source documents if available
-        source_documents = []
-        if 'source_documents' in response:
-            print(f"Found {len(response['source_documents'])} source documents")
-            for doc in response['source_documents']:
-                source_documents.append({
-                    'content': doc.page_content,
-                    'metadata': doc.metadata
-                })
-        else:
-            print("No source documents found in response")
-            # Debug what's in the response
-            print(f"Response keys: {response.keys()}")
+        After a failed check or build the index is dropped (vector search
+        only) and retried with exponential backoff, up to
+        KEYWORD_INDEX_MAX_BACKOFF seconds apart.
+        """
+        now = time.monotonic()
+        with self._keyword_index_lock:
+            if now >= self._keyword_index_next_check:
+                try:
+                    fingerprint = self._collection_fingerprint()
+                    if fingerprint != self._keyword_index_fingerprint:
+                        with metrics.timer("rag_keyword_index_seconds"):
+                            data = self.vector_db.get(include=["documents", "metadatas"])
+                            self._keyword_index = BM25Index([
+                                Document(id=doc_id, page_content=text or '', metadata=metadata or {})
+                                for doc_id, text, metadata in zip(data['ids'], data['documents'], data['metadatas'])
+                            ])
+                        self._keyword_index_fingerprint = fingerprint
+                        log(f"Built keyword index over {len(self._keyword_index)} documents")
+                    self._keyword_index_failures = 0
+                    self._keyword_index_next_check = now + self.keyword_index_check_seconds
+                except Exception as e:
+                    # A stale index would fuse IDs the vector store no longer has
+                    self._keyword_index = None
+                    self._keyword_index_fingerprint = None
+                    self._keyword_index_failures += 1
+                    backoff = min(KEYWORD_INDEX_MAX_BACKOFF, 2 ** self._keyword_index_failures)
+                    self._keyword_index_next_check = now + backoff
+                    log(f"Error building keyword index, using vector search only for {backoff}s: {e}")
+            index = self._keyword_index
+        return index if index is not None and len(index) else None
 
-        # The response structure from ConversationalRetrievalChain is different
-        # It typically returns a dictionary with 'answer' and 'chat_history'
-        return {
-            'text': response['answer'],
-            'next_action': 'continue_same',
-            'suggestions': [],
-            'source_documents': source_documents
-        }
+    def _query_collection(self, embedding: List[float], k: int) -> Optional[List[Document]]:
+        """Query the Chroma collection behind the LangChain wrapper, or None if it is unavailable.
 
-    def get_feedback_prompt(self, stage: str) -> Dict[str, str]:
-        """Get appropriate feedback prompt for the current conversation stage"""
-        session = self.Session()
-        prompt = session.query(FeedbackPrompt).filter_by(stage=stage).first()
-        session.close()
-        if prompt:
-            return {'id': prompt.prompt_id, 'text': prompt.prompt_text, 'next_action': prompt.next_action}
-        else:
-            # Fallback if no specific prompt found for the stage
-            return {'id': 'FP000', 'text': 'Thank you for your feedback!', 'next_action': 'A03'} # A03 for end_session
+        The wrapper's similarity search drops document IDs, which hybrid
+        fusion and /documents/{id} need, so this is the one place that uses
+        its private ``_collection``. None (after a wrapper upgrade that
+        renamed or changed it) makes the caller use the public API instead.
+        """
+        collection = getattr(self.vector_db, '_collection', None)
+        if collection is None:
+            return None
+        try:
+            result = collection.query(
+                query_embeddings=[embedding],
+                n_results=k,
+                include=["documents", "metadatas", "distances"]
+            )
+            rows = zip(result['ids'][0], result['documents'][0], result['metadatas'][0], result['distances'][0])
+        except (AttributeError, TypeError, KeyError) as e:
+            log(f"Chroma collection query unavailable, using the LangChain search API: {e}")
+            return None
+        return [
+            Document(id=doc_id, page_content=text or '', metadata={**(metadata or {}), 'score': float(distance)})
+            for doc_id, text, metadata, distance in rows
+        ]
 
-    def _analyze_sentiment(self, feedback: str) -> Dict[str, Any]:
+    def _vector_search(self, embedding: List[float], k: int) -> List[Document]:
+        """Nearest documents to an embedding, with their Chroma IDs and distances in metadata['score']"""
+        with metrics.timer("rag_vector_search_seconds"):
+            documents = self._query_collection(embedding, k)
+            if documents is not None:
+                return documents
+            # Distances, like the collection query; IDs only if the wrapper returns them
+            results = self.vector_db.similarity_search_by_vector_with_relevance_scores(embedding, k=k)
+        return [
+            Document(id=getattr(doc, 'id', None), page_content=doc.page_content, metadata={**doc.metadata, 'score': float(score)})
+            for doc, score in results
+        ]
+
+    def search(self, embedding: List[float], k: Optional[int] = None, query: Optional[str] = None) -> List[Document]:
+        """Search the vector store with a precomputed query embedding.
+
+        Given the query text, vector and BM25 keyword candidates are fused by
+        reciprocal rank fusion, which keeps exact terms like "PTSD" that the
+        embedding ranks low. Each returned document carries its vector
+        distance (lower is closer, None if only the keyword search found it)
+        in metadata['score'], and its fused score in metadata['rrf_score'].
+        """
+        k = k or self.retrieval_k
+        index = self.keyword_index() if query and self.hybrid_retrieval else None
+        documents = self._vector_search(embedding, k * self.hybrid_candidates if index is not None else k)
+        if index is None:
+            return documents
+        if any(doc.id is None for doc in documents):
+            # Fusion matches chunks by ID, so without them only the vector results can be used
+            return documents[:k]
+
+        with metrics.timer("rag_keyword_search_seconds"):
+            keyword_results = index.search(query, k * self.hybrid_candidates)
+        # Both lists come from the same collection, so Chroma IDs identify a chunk in either
+        by_id = {doc.id: doc for doc in documents}
+        for doc, _ in keyword_results:
+            # Index documents are shared, so hand out copies
+            by_id.setdefault(doc.id, Document(
+                id=doc.id, page_content=doc.page_content, metadata={**doc.metadata, 'score': None}
+            ))
+        fused = reciprocal_rank_fusion([
+            [doc.id for doc in documents],
+            [doc.id for doc, _ in keyword_results]
+        ])
+        hybrid = []
+        seen_contents = set()
+        for document_id, rrf_score in fused:
+            doc = by_id[document_id]
+            # The same text stored under two IDs would take two of the k slots
+            if doc.page_content in seen_contents:
+                continue
+            seen_contents.add(doc.page_content)
+            doc.metadata = {**doc.metadata, 'rrf_score': rrf_score}
+            hybrid.append(doc)
+            if len(hybrid) == k:
+                break
+        return hybrid
+
+    def get_document(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch one vector store document by ID"""
+        with metrics.timer("rag_document_fetch_seconds"):
+            result = self.vector_db.get(ids=[document_id], include=["documents", "metadatas"])
+        if not result.get('ids'):
+            return None
+        return {'id': result['ids'][0], 'content': result['documents'][0], 'metadata': result['metadatas'][0] or {}}
+
+    async def asearch(self, embedding: List[float], k: Optional[int] = None, query: Optional[str] = None) -> List[Document]:
+        """Search the vector store without blocking the event loop"""
+        return await asyncio.to_thread(self.search, embedding, k, query)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Async variant of embed_queries"""
+        return await self._run_on_embedding_executor(self.embed_queries, texts)
+
+    async def asearch_many(
+        self,
+        embeddings: List[List[float]],
+        k: Optional[int] = None,
+        queries: Optional[List[str]] = None
+    ) -> List[List[Document]]:
+        """Run several vector searches together in one worker thread"""
+        queries = queries or [None] * len(embeddings)
+        return await asyncio.to_thread(lambda: [self.search(embedding, k, query) for embedding, query in zip(embeddings, queries)])
+
+    def kb_version(self) -> Optional[str]:
+        """Current knowledge base version, or None when it cannot be read (response caches are then bypassed)"""
+        try:
+            return kb_cache.version()
+        except Exception as e:
+            log(f"Error reading KB version, skipping response caches: {e}")
+            return None
+
+    def warm_up(self, queries: List[str]) -> int:
+        """Run sample queries through embedding and vector search so the first real request is fast.
+
+        Returns the number of documents retrieved.
+        """
+        retrieved = 0
+        for embedding, query in zip(self.embed_queries(queries), queries):
+            retrieved += len(self.search(embedding, query=query))
+        return retrieved
+
+    def close(self) -> None:
+        """Release the engine's worker threads and DB connections"""
+        self.sentiment_scorer.stop()
+        self.embedding_executor.shutdown(wait=False)
+        self.summary_executor.shutdown(wait=False)
+        self.db_engine.dispose()
+
+    def analyze_sentiment(self, feedback: str) -> Dict[str, Any]:
         """Analyze sentiment of feedback using LLM"""
         try:
             messages = [
@@ -202,7 +479,7 @@ Helpful Answer:"""
                 HumanMessage(content=SENTIMENT_ANALYSIS_PROMPT.format(feedback=feedback))
             ]
             
-            response = self.llm.invoke(messages)
+            response = self.invoke_llm(messages, "sentiment_analysis_seconds")
             result = json.loads(response.content)
             
             # Convert sentiment to numerical score (-1 to 1)
@@ -220,7 +497,7 @@ Helpful Answer:"""
             }
             
         except Exception as e:
-            print(f"Error in sentiment analysis: {e}")
+            log(f"Error in sentiment analysis: {e}")
             return {
                 'sentiment': 'neutral',
                 'confidence': 0.5,
@@ -229,6 +506,477 @@ Helpful Answer:"""
                 'error': str(e)
             }
 
+    def summarize_history(self, summary: str, messages: List[BaseMessage], max_tokens: int) -> str:
+        """Fold messages into a rolling conversation summary"""
+        prompt = SUMMARY_TEMPLATE.format(
+            # Roughly 0.75 words per token
+            max_words=max(1, int(max_tokens * 0.75)),
+            summary=summary or "(none)",
+            new_lines=format_chat_history(messages)
+        )
+        return self.invoke_llm(prompt, "rag_summary_seconds").content
+
+    def invoke_llm(self, prompt: Any, metric: str) -> BaseMessage:
+        """Call the LLM, recording latency under ``metric`` and token usage"""
+        with metrics.timer(metric):
+            response = self.llm.invoke(prompt)
+        record_token_usage(response, metric)
+        return response
+
+    async def ainvoke_llm(self, prompt: Any, metric: str) -> BaseMessage:
+        """Async variant of invoke_llm"""
+        with metrics.timer(metric):
+            response = await self.llm.ainvoke(prompt)
+        record_token_usage(response, metric)
+        return response
+
+# Shared engines, keyed by the config values that determine the heavy resources
+_engines: Dict[Tuple[str, str, str], MentalHealthAIEngine] = {}
+_engines_lock = threading.Lock()
+
+def get_ai_engine(config: Dict[str, Any]) -> MentalHealthAIEngine:
+    """Get or create the process-wide engine for a config"""
+    key = (config['db_connection_string'], config['vector_db_path'], config['model_name'])
+    engine = _engines.get(key)
+    if engine is not None:
+        return engine
+    with _engines_lock:
+        # Another thread may have built it while we waited for the lock
+        engine = _engines.get(key)
+        if engine is None:
+            engine = MentalHealthAIEngine(config)
+            _engines[key] = engine
+        return engine
+
+def ai_engines() -> List[MentalHealthAIEngine]:
+    """Return the engines built so far, without building any"""
+    return list(_engines.values())
+
+class MentalHealthAIOrchestrator:
+    """Per-conversation state on top of a shared MentalHealthAIEngine.
+
+    Only the conversation memory is created per instance, so a new session
+    is cheap once the engine exists.
+    """
+
+    def __init__(self, config: Dict[str, Any], engine: Optional[MentalHealthAIEngine] = None):
+        self.config = config
+        self.engine = engine or get_ai_engine(config)
+
+        # Shared resources, exposed under their historical attribute names
+        self.db_engine = self.engine.db_engine
+        self.Session = self.engine.Session
+        self.embeddings = self.engine.embeddings
+        self.llm = self.engine.llm
+        self.vector_db = self.engine.vector_db
+
+        # Recent turns within a token budget plus a rolling summary of older ones,
+        # so the condense prompt stays bounded however long the session runs
+        self.memory = TokenBudgetMemory(
+            max_tokens=self.config.get('memory_max_tokens', 1500),
+            summary_tokens=self.config.get('memory_summary_tokens', 300),
+            summarize=lambda summary, messages: self.engine.summarize_history(summary, messages, self.memory.summary_tokens),
+            executor=self.engine.summary_executor
+        )
+
+        # Number of turns persisted in the shared conversation store that this
+        # memory reflects; a different stored value means another worker moved on
+        self.revision = 0
+        # Completed turns not yet in the conversation store, oldest first
+        self.unpersisted_messages: List[BaseMessage] = []
+
+    def restore_history(self, messages: List[BaseMessage], revision: int, summary: str = "", summarized_messages: int = 0) -> None:
+        """Replace the conversation memory with the summary and history loaded from the conversation store"""
+        self.memory.load(messages, summary, summarized_messages)
+        self.revision = revision
+        self.unpersisted_messages = []
+
+    def next_unpersisted_turn(self) -> List[BaseMessage]:
+        """Return the oldest turn not yet in the conversation store and mark it persisted"""
+        messages = self.unpersisted_messages[:2]
+        del self.unpersisted_messages[:2]
+        return messages
+
+    def memory_size_bytes(self) -> int:
+        """Approximate bytes held by this conversation's state"""
+        unpersisted = sum(256 + len(str(m.content).encode('utf-8')) for m in self.unpersisted_messages)
+        # Fixed overhead for the orchestrator, memory and chain objects
+        return 4096 + self.memory.size_bytes() + unpersisted
+
+    def get_problem_list(self) -> List[Dict[str, str]]:
+        """Get list of available mental health problems"""
+        with metrics.timer("db_read_seconds", operation="get_problem_list"):
+            session = self.Session()
+            problems = session.query(Problem).all()
+            session.close()
+        return [{'id': p.problem_id, 'name': p.problem_name} for p in problems]
+
+    def get_self_assessment(self, problem_id: str) -> List[Dict[str, Any]]:
+        """Get self-assessment questions for a specific problem"""
+        with metrics.timer("db_read_seconds", operation="get_self_assessment"):
+            session = self.Session()
+            questions = session.query(SelfAssessment).filter_by(problem_id=problem_id).all()
+            session.close()
+        return [{'id': q.question_id, 'text': q.question_text, 'type': q.response_type} for q in questions]
+
+    def get_suggestions(self, problem_id: str) -> List[Dict[str, Any]]:
+        """Get suggestions for a specific problem"""
+        with metrics.timer("db_read_seconds", operation="get_suggestions"):
+            session = self.Session()
+            suggestions = session.query(Suggestion).filter_by(problem_id=problem_id).all()
+            session.close()
+        return [{'id': s.suggestion_id, 'text': s.suggestion_text, 'resource': s.resource_link} for s in suggestions]
+
+    def _should_condense(self, message: Optional[str]) -> bool:
+        """Decide whether a turn needs the condense LLM call, counting the outcome"""
+        if not self.memory.has_history():
+            outcome = "skipped_first_turn"
+        elif message is not None and self.config.get('condense_skip_self_contained', True) and is_self_contained(message):
+            outcome = "skipped_self_contained"
+        else:
+            outcome = "condensed"
+        metrics.increment("rag_condense_total", outcome=outcome)
+        return outcome == "condensed"
+
+    def _condense_question(self, question: str, message: Optional[str] = None) -> str:
+        """Rephrase a follow-up question into a standalone question using the chat history.
+
+        Skipped on first turns and, given the raw user ``message``, when the
+        message reads as self-contained.
+        """
+        if not self._should_condense(message):
+            return question
+        prompt = CONDENSE_QUESTION_PROMPT.format(chat_history=self.memory.render(), question=question)
+        return self.engine.invoke_llm(prompt, "rag_condense_seconds").content
+
+    async def _acondense_question(self, question: str, message: Optional[str] = None) -> str:
+        """Async variant of _condense_question"""
+        if not self._should_condense(message):
+            return question
+        prompt = CONDENSE_QUESTION_PROMPT.format(chat_history=self.memory.render(), question=question)
+        return (await self.engine.ainvoke_llm(prompt, "rag_condense_seconds")).content
+
+    def _retrieve_documents(self, question: str) -> List[Document]:
+        """Retrieve the knowledge base documents relevant to a standalone question"""
+        return self.engine.search(self.engine.embed_query(question), query=question)
+
+    async def _aretrieve_documents(self, question: str) -> List[Document]:
+        """Async variant of _retrieve_documents"""
+        return await self.engine.asearch(await self.engine.aembed_query(question), query=question)
+
+    def _build_qa_prompt(self, question: str, documents: List[Document]) -> str:
+        """Stuff the retrieved documents into the QA prompt"""
+        context = "\n\n".join(doc.page_content for doc in documents)
+        return QA_PROMPT.format(context=context, question=question)
+
+    def _save_turn(self, question: str, answer: str) -> None:
+        """Append a completed turn to the conversation memory"""
+        self.unpersisted_messages.extend(self.memory.add_turn(question, answer))
+
+    @staticmethod
+    def _serialize_documents(documents: List[Document]) -> List[Dict[str, Any]]:
+        return [{
+            'id': doc.id,
+            'score': doc.metadata.get('score'),
+            'content': doc.page_content,
+            'metadata': doc.metadata
+        } for doc in documents]
+
+    def _route_intent(self, message: str) -> Optional[Dict[str, Any]]:
+        """Return a templated answer if the message is a structured KB question"""
+        if not self.config.get('intent_router_enabled', True):
+            return None
+        try:
+            with metrics.timer("intent_router_seconds"):
+                routed = self.engine.intent_router.route(message)
+        except Exception as e:
+            log(f"Error routing intent, falling back to the LLM: {e}")
+            return None
+        metrics.increment("intent_router_total", intent=routed['intent'] if routed else "none")
+        return routed
+
+    def _answer_routed(self, english_prompt: str, routed: Dict[str, Any]) -> Dict[str, Any]:
+        """Save a routed turn to memory and shape it like an LLM response"""
+        log(f"Answered from the knowledge base (intent: {routed['intent']})")
+        self._save_turn(english_prompt, routed['text'])
+        return {
+            'text': routed['text'],
+            'next_action': 'continue_same',
+            'suggestions': routed['suggestions'],
+            'source_documents': [],
+            'intent': routed['intent']
+        }
+
+    def _routed_events(self, english_prompt: str, routed: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Stream events for a routed answer: no sources and the whole text as one token"""
+        response = self._answer_routed(english_prompt, routed)
+        yield {'event': 'sources', 'data': {'source_documents': []}}
+        yield {'event': 'token', 'data': {'token': response['text']}}
+        yield {'event': 'done', 'data': {
+            'text': response['text'],
+            'next_action': response['next_action'],
+            'suggestions': response['suggestions']
+        }}
+
+    def _build_response(self, answer: str, documents: List[Document]) -> Dict[str, Any]:
+        return {
+            'text': answer,
+            'next_action': 'continue_same',
+            'suggestions': [],
+            'source_documents': self._serialize_documents(documents)
+        }
+
+    def list_suggestions(
+        self,
+        problem_ids: Optional[List[str]] = None,
+        after: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """List suggestions with their problem names in one query.
+
+        Results are ordered by suggestion ID and paged by keyset: pass the
+        returned cursor as ``after`` to get the next page. The cursor is None
+        on the last page.
+        """
+        session = self.Session()
+        try:
+            query = session.query(
+                Suggestion.suggestion_id,
+                Suggestion.suggestion_text,
+                Suggestion.resource_link,
+                Suggestion.problem_id,
+                Problem.problem_name
+            ).outerjoin(Problem, Suggestion.problem_id == Problem.problem_id)
+            if problem_ids:
+                query = query.filter(Suggestion.problem_id.in_(problem_ids))
+            if after:
+                query = query.filter(Suggestion.suggestion_id > after)
+            query = query.order_by(Suggestion.suggestion_id)
+            if limit:
+                # Fetch one extra row to know whether another page exists
+                query = query.limit(limit + 1)
+            with metrics.timer("db_read_seconds", operation="list_suggestions"):
+                rows = query.all()
+        finally:
+            session.close()
+
+        next_cursor = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1].suggestion_id
+        suggestions = [{
+            'id': r.suggestion_id,
+            'text': r.suggestion_text,
+            'resource': r.resource_link,
+            'problem_id': r.problem_id,
+            'problem_name': r.problem_name
+        } for r in rows]
+        return suggestions, next_cursor
+
+    def _response_cache_key(self, message: str, version: Optional[str]) -> Optional[str]:
+        if version is None or not self.engine.response_cache.enabled:
+            return None
+        return response_cache_key(normalize_query(message), self.engine.config['model_name'], version)
+
+    def _use_semantic_cache(self, message: str, version: Optional[str]) -> bool:
+        # Near matches of crisis or negated messages can mean the opposite
+        return version is not None and self.engine.semantic_cache.enabled and not needs_personal_answer(message)
+
+    def _answer_first_turn(self, message: str, english_prompt: str) -> Tuple[str, List[Document]]:
+        """Answer a history-free turn, reusing earlier answers where possible.
+
+        The persistent response cache is checked first for the same normalized
+        message, then the semantic cache for a near-identical question unless
+        the message touches on a crisis or contains a negation. With
+        no history there is nothing to condense, and the raw message is
+        embedded once for both the semantic lookup and retrieval.
+        """
+        version = self.engine.kb_version()
+        cache_key = self._response_cache_key(message, version)
+        if cache_key is not None:
+            cached = self.engine.response_cache.get(cache_key)
+            if cached is not None:
+                log("Answered from response cache")
+                return cached
+
+        embedding = self.engine.embed_query(message)
+        use_semantic_cache = self._use_semantic_cache(message, version)
+        if use_semantic_cache:
+            cached = self.engine.semantic_cache.lookup(embedding, version)
+            if cached is not None:
+                log("Answered from semantic cache")
+                return cached
+
+        documents = self.engine.search(embedding, query=message)
+        log(f"Found {len(documents)} source documents")
+        answer = self.engine.invoke_llm(self._build_qa_prompt(english_prompt, documents), "rag_qa_llm_seconds").content
+
+        if use_semantic_cache:
+            self.engine.semantic_cache.store(embedding, (answer, documents), version)
+        if cache_key is not None:
+            self.engine.response_cache.set(cache_key, answer, documents, self.engine.config['model_name'], version)
+        return answer, documents
+
+    async def _aanswer_first_turn(self, message: str, english_prompt: str) -> Tuple[str, List[Document]]:
+        """Async variant of _answer_first_turn"""
+        version = await asyncio.to_thread(self.engine.kb_version)
+        cache_key = self._response_cache_key(message, version)
+        if cache_key is not None:
+            cached = await asyncio.to_thread(self.engine.response_cache.get, cache_key)
+            if cached is not None:
+                log("Answered from response cache")
+                return cached
+
+        embedding = await self.engine.aembed_query(message)
+        use_semantic_cache = self._use_semantic_cache(message, version)
+        if use_semantic_cache:
+            cached = self.engine.semantic_cache.lookup(embedding, version)
+            if cached is not None:
+                log("Answered from semantic cache")
+                return cached
+
+        documents = await self.engine.asearch(embedding, query=message)
+        log(f"Found {len(documents)} source documents")
+        answer = (await self.engine.ainvoke_llm(self._build_qa_prompt(english_prompt, documents), "rag_qa_llm_seconds")).content
+
+        if use_semantic_cache:
+            self.engine.semantic_cache.store(embedding, (answer, documents), version)
+        if cache_key is not None:
+            await asyncio.to_thread(
+                self.engine.response_cache.set, cache_key, answer, documents, self.engine.config['model_name'], version
+            )
+        return answer, documents
+
+    def process_user_message(self, user_id: str, message: str) -> Dict[str, Any]:
+        """Process a user message and generate a response using RAG"""
+        # Add instruction to respond in English
+        english_prompt = f"Please respond in English. {message}"
+
+        routed = self._route_intent(message)
+        if routed is not None:
+            return self._answer_routed(english_prompt, routed)
+
+        if not self.memory.has_history():
+            metrics.increment("rag_condense_total", outcome="skipped_first_turn")
+            answer, documents = self._answer_first_turn(message, english_prompt)
+        else:
+            question = self._condense_question(english_prompt, message)
+            documents = self._retrieve_documents(question)
+            log(f"Found {len(documents)} source documents")
+
+            answer = self.engine.invoke_llm(self._build_qa_prompt(question, documents), "rag_qa_llm_seconds").content
+        self._save_turn(english_prompt, answer)
+
+        return self._build_response(answer, documents)
+
+    async def _agenerate_answer(self, english_prompt: str, message: Optional[str] = None) -> Tuple[str, List[Document]]:
+        """Run condense, retrieval and QA for a prompt without touching memory"""
+        question = await self._acondense_question(english_prompt, message)
+        documents = await self._aretrieve_documents(question)
+        log(f"Found {len(documents)} source documents")
+
+        answer = (await self.engine.ainvoke_llm(self._build_qa_prompt(question, documents), "rag_qa_llm_seconds")).content
+        return answer, documents
+
+    async def aprocess_user_message(self, user_id: str, message: str) -> Dict[str, Any]:
+        """Async variant of process_user_message.
+
+        LLM calls are awaited natively and embedding/search run off the event
+        loop, so many conversations can be in flight on one worker. First-turn
+        messages have no history, so their answer depends only on the message:
+        identical ones already in flight share a single computation, and
+        paraphrases of an earlier question are served from the semantic cache.
+        """
+        english_prompt = f"Please respond in English. {message}"
+
+        routed = await asyncio.to_thread(self._route_intent, message)
+        if routed is not None:
+            return self._answer_routed(english_prompt, routed)
+
+        if self.memory.has_history():
+            answer, documents = await self._agenerate_answer(english_prompt, message)
+        else:
+            metrics.increment("rag_condense_total", outcome="skipped_first_turn")
+            answer, documents = await self.engine.single_flight.do(
+                normalize_query(message),
+                lambda: self._aanswer_first_turn(message, english_prompt)
+            )
+        self._save_turn(english_prompt, answer)
+
+        return self._build_response(answer, documents)
+
+    def stream_user_message(self, user_id: str, message: str) -> Iterator[Dict[str, Any]]:
+        """Process a user message, yielding the sources first and then answer tokens.
+
+        Yields dicts with an 'event' name ('sources', 'token' or 'done') and a
+        JSON-serializable 'data' payload. The turn is saved to memory only once
+        the answer is complete.
+        """
+        english_prompt = f"Please respond in English. {message}"
+
+        routed = self._route_intent(message)
+        if routed is not None:
+            yield from self._routed_events(english_prompt, routed)
+            return
+
+        question = self._condense_question(english_prompt, message)
+        documents = self._retrieve_documents(question)
+        yield {'event': 'sources', 'data': {'source_documents': self._serialize_documents(documents)}}
+
+        tokens = []
+        with metrics.timer("rag_qa_llm_seconds", streamed="true"):
+            for chunk in self.llm.stream(self._build_qa_prompt(question, documents)):
+                record_token_usage(chunk, "rag_qa_llm_seconds")
+                if chunk.content:
+                    tokens.append(chunk.content)
+                    yield {'event': 'token', 'data': {'token': chunk.content}}
+
+        answer = "".join(tokens)
+        self._save_turn(english_prompt, answer)
+        yield {'event': 'done', 'data': {'text': answer, 'next_action': 'continue_same', 'suggestions': []}}
+
+    async def astream_user_message(self, user_id: str, message: str) -> AsyncIterator[Dict[str, Any]]:
+        """Async variant of stream_user_message"""
+        english_prompt = f"Please respond in English. {message}"
+
+        routed = await asyncio.to_thread(self._route_intent, message)
+        if routed is not None:
+            for event in self._routed_events(english_prompt, routed):
+                yield event
+            return
+
+        question = await self._acondense_question(english_prompt, message)
+        documents = await self._aretrieve_documents(question)
+        yield {'event': 'sources', 'data': {'source_documents': self._serialize_documents(documents)}}
+
+        tokens = []
+        with metrics.timer("rag_qa_llm_seconds", streamed="true"):
+            async for chunk in self.llm.astream(self._build_qa_prompt(question, documents)):
+                record_token_usage(chunk, "rag_qa_llm_seconds")
+                if chunk.content:
+                    tokens.append(chunk.content)
+                    yield {'event': 'token', 'data': {'token': chunk.content}}
+
+        answer = "".join(tokens)
+        self._save_turn(english_prompt, answer)
+        yield {'event': 'done', 'data': {'text': answer, 'next_action': 'continue_same', 'suggestions': []}}
+
+    def get_feedback_prompt(self, stage: str) -> Dict[str, str]:
+        """Get appropriate feedback prompt for the current conversation stage"""
+        with metrics.timer("db_read_seconds", operation="get_feedback_prompt"):
+            session = self.Session()
+            prompt = session.query(FeedbackPrompt).filter_by(stage=stage).first()
+            session.close()
+        if prompt:
+            return {'id': prompt.prompt_id, 'text': prompt.prompt_text, 'next_action': prompt.next_action}
+        else:
+            # Fallback if no specific prompt found for the stage
+            return {'id': 'FP000', 'text': 'Thank you for your feedback!', 'next_action': 'A03'} # A03 for end_session
+
+    def _analyze_sentiment(self, feedback: str) -> Dict[str, Any]:
+        """Analyze sentiment of feedback using LLM"""
+        return self.engine.analyze_sentiment(feedback)
+
     def store_feedback(
         self,
         user_id: str,
@@ -237,14 +985,20 @@ Helpful Answer:"""
         ai_response: Optional[str] = None,
         problem_id: Optional[str] = None,
         suggestion_id: Optional[str] = None,
-        context: Optional[Dict] = None
+        context: Optional[Dict] = None,
+        sentiment: Optional[Dict[str, Any]] = None
     ) -> str:
-        """Store feedback in the database"""
+        """Store feedback in the database.
+
+        The feedback is saved with a local sentiment estimate and queued for
+        authoritative LLM scoring, which updates feedback_sentiment later.
+        """
         session = self.Session()
         try:
-            # Analyze sentiment
-            sentiment = self._analyze_sentiment(user_feedback)
-            
+            # Cheap local estimate; the LLM score replaces it in the background
+            if sentiment is None:
+                sentiment = estimate_sentiment(user_feedback)
+
             # Create feedback record
             feedback_id = str(uuid.uuid4())
             feedback = Feedback(
@@ -260,13 +1014,19 @@ Helpful Answer:"""
                 created_at=datetime.utcnow()
             )
             
-            session.add(feedback)
-            session.commit()
+            with metrics.timer("db_write_seconds", operation="store_feedback"):
+                session.add(feedback)
+                # Keep the report rollups in step with the raw feedback, in the same transaction
+                record_feedback(session, feedback)
+                session.add(FeedbackScoringJob(feedback_id=feedback_id, created_at=feedback.created_at))
+                session.commit()
+            log(f"Stored feedback {feedback_id} for user {user_id} (estimated sentiment {sentiment['sentiment_score']:.2f})")
+            self.engine.sentiment_scorer.submit(feedback_id)
             return feedback_id
             
         except Exception as e:
             session.rollback()
-            print(f"Error storing feedback: {e}")
+            log(f"Error storing feedback: {e}")
             raise
         finally:
             session.close()
@@ -281,8 +1041,14 @@ Helpful Answer:"""
         problem_id: Optional[str] = None,
         suggestion_id: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Process user feedback and determine next action"""
+        """Process user feedback and determine next action.
+
+        Replies from a local sentiment estimate without calling the LLM; the
+        stored sentiment is rescored in the background.
+        """
         try:
+            sentiment = estimate_sentiment(feedback)
+
             # Store the feedback
             feedback_id = self.store_feedback(
                 user_id=user_id or 'unknown',
@@ -291,12 +1057,10 @@ Helpful Answer:"""
                 ai_response=ai_response,
                 problem_id=problem_id,
                 suggestion_id=suggestion_id,
-                context=context
+                context=context,
+                sentiment=sentiment
             )
-            
-            # Analyze sentiment for response generation
-            sentiment = self._analyze_sentiment(feedback)
-            
+
             # Determine response based on sentiment
             if sentiment['sentiment_score'] > 0.3:  # Positive
                 response = {
@@ -327,13 +1091,94 @@ Helpful Answer:"""
             return response
             
         except Exception as e:
-            print(f"Error processing feedback: {e}")
+            log(f"Error processing feedback: {e}")
             return {
                 'text': "Thank you for your feedback. I'll use this to improve.",
                 'next_action': 'A01',
                 'error': str(e)
             }
 
+async def aprocess_message_batch(
+    engine: MentalHealthAIEngine,
+    items: List[Tuple[MentalHealthAIOrchestrator, str, str]],
+    max_concurrency: int = 8
+) -> List[Dict[str, Any]]:
+    """Process many (orchestrator, user_id, message) items together.
+
+    Items are processed in rounds so that several messages for the same
+    conversation run in order. Within a round, the condense step and the QA
+    LLM calls fan out with at most ``max_concurrency`` calls in flight, all
+    questions are embedded in one batched call and the vector searches run
+    together. Results are returned in input order; a failed item yields
+    ``{'error': ...}`` instead of a response.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def bounded(coro):
+        async with semaphore:
+            return await coro
+
+    # Round r holds the r-th message of every conversation in the batch
+    rounds: List[List[int]] = []
+    turns: Dict[int, int] = {}
+    for index, (orchestrator, _, _) in enumerate(items):
+        turn = turns.get(id(orchestrator), 0)
+        turns[id(orchestrator)] = turn + 1
+        if turn == len(rounds):
+            rounds.append([])
+        rounds[turn].append(index)
+
+    for indices in rounds:
+        prompts = {i: f"Please respond in English. {items[i][2]}" for i in indices}
+        # Structured KB questions are answered from the DB and skip the LLM stages
+        routed = await asyncio.to_thread(lambda: [items[i][0]._route_intent(items[i][2]) for i in indices])
+        for i, answer in zip(indices, routed):
+            if answer is not None:
+                results[i] = items[i][0]._answer_routed(prompts[i], answer)
+        indices = [i for i, answer in zip(indices, routed) if answer is None]
+        if not indices:
+            continue
+
+        condensed = await asyncio.gather(
+            *(bounded(items[i][0]._acondense_question(prompts[i], items[i][2])) for i in indices),
+            return_exceptions=True
+        )
+
+        live, questions = [], []
+        for i, question in zip(indices, condensed):
+            if isinstance(question, Exception):
+                results[i] = {'error': str(question)}
+            else:
+                live.append(i)
+                questions.append(question)
+        if not live:
+            continue
+
+        try:
+            embeddings = await engine.aembed_queries(questions)
+            documents = await engine.asearch_many(embeddings, queries=questions)
+        except Exception as e:
+            log(f"Error retrieving documents for batch: {e}")
+            for i in live:
+                results[i] = {'error': str(e)}
+            continue
+
+        answers = await asyncio.gather(
+            *(bounded(engine.ainvoke_llm(items[i][0]._build_qa_prompt(question, docs), "rag_qa_llm_seconds"))
+              for i, question, docs in zip(live, questions, documents)),
+            return_exceptions=True
+        )
+        for i, docs, answer in zip(live, documents, answers):
+            if isinstance(answer, Exception):
+                results[i] = {'error': str(answer)}
+                continue
+            orchestrator = items[i][0]
+            orchestrator._save_turn(prompts[i], answer.content)
+            results[i] = orchestrator._build_response(answer.content, docs)
+
+    return results
+
 # Example configuration - replace with your actual OpenAI API key
 config = {
     'db_connection_string': 'sqlite:///mental_health_kb.db',
@@ -382,97 +1227,3 @@ if __name__ == "__main__":
     feedback_response = orchestrator.process_feedback("Yes, that was helpful", {'current_problem': selected_problem})
     print(f"AI: {feedback_response['text']}")
     print(f"Next action: {feedback_response['next_action']}")
-
-
-# Implement Caching for Responses
-    
-    # Add caching decorator for expensive operations
-    @lru_cache(maxsize=100)
-    def _get_cached_embedding(self, text):
-        """Cache embeddings to avoid recomputing them"""
-        return self.embedding_function.embed_query(text)
-    
-    def _get_cache_key(self, user_id, message):
-        """Generate a cache key for a user message"""
-        cache_str = f"{user_id}:{message}"
-        return hashlib.md5(cache_str.encode()).hexdigest()
-    
-    def _check_cache(self, cache_key):
-        """Check if a response is cached"""
-        cache_file = os.path.join(self.cache_dir, f"{cache_key}.json")
-        if os.path.exists(cache_file):
-            with open(cache_file, 'r') as f:
-                return json.load(f)
-        return None
-    
-    def _save_to_cache(self, cache_key, response):
-        """Save a response to cache"""
-        cache_file = os.path.join(self.cache_dir, f"{cache_key}.json")
-        with open(cache_file, 'w') as f:
-            json.dump(response, f)
-    
-    def process_user_message(self, user_id, message):
-        """Process a user message with caching"""
-        # Check cache first
-        cache_key = self._get_cache_key(user_id, message)
-        cached_response = self._check_cache(cache_key)
-        
-        if cached_response:
-            print("Using cached response")
-            return cached_response
-        
-        # If not cached, process normally
-        # The response structure from ConversationalRetrievalChain is different
-        # It typically returns a dictionary with 'answer' and 'chat_history'
-        return {
-            'text': response['answer'],
-            'next_action': 'continue_same',
-            'suggestions': [],
-            'source_documents': source_documents
-        }
-
-    def get_feedback_prompt(self, stage: str) -> Dict[str, str]:
-        """Get appropriate feedback prompt for the current conversation stage"""
-        session = self.Session()
-        prompt = session.query(FeedbackPrompt).filter_by(stage=stage).first()
-        session.close()
-        if prompt:
-            return {'id': prompt.prompt_id, 'text': prompt.prompt_text, 'next_action': prompt.next_action}
-        else:
-            # Fallback if no specific prompt found for the stage
-            return {'id': 'FP000', 'text': 'Thank you for your feedback!', 'next_action': 'A03'} # A03 for end_session
-
-    def _analyze_sentiment(self, feedback: str) -> Dict[str, Any]:
-        """Analyze sentiment of feedback using LLM"""
-        try:
-            messages = [
-                SystemMessage(content="You are a sentiment analysis assistant. Analyze the sentiment and extract key phrases."),
-                HumanMessage(content=SENTIMENT_ANALYSIS_PROMPT.format(feedback=feedback))
-            ]
-            
-            response = self.llm.invoke(messages)
-            result = json.loads(response.content)
-            
-            # Convert sentiment to numerical score (-1 to 1)
-            sentiment_score = 0
-            if result.get('sentiment') == 'positive':
-                sentiment_score = min(1.0, max(0.0, result.get('confidence', 0.7)))
-            elif result.get('sentiment') == 'negative':
-                sentiment_score = -min(1.0, max(0.0, result.get('confidence', 0.7)))
-                
-            return {
-                'sentiment': result.get('sentiment', 'neutral'),
-                'confidence': result.get('confidence', 0.5),
-                'key_phrases': result.get('key_phrases', []),
-                'sentiment_score': sentiment_score
-            }
-            
-        except Exception as e:
-            print(f"Error in sentiment analysis: {e}")
-            return {
-                'sentiment': 'neutral',
-                'confidence': 0.5,
-                'key_phrases': [],
-                'sentiment_score': 0,
-                'error': str(e)
-            }
\ No newline at end of file
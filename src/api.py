@@ -1,35 +1,86 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 import os
+import json
 import uuid
+import base64
+import binascii
+import functools
+import threading
 from datetime import datetime
 from dotenv import load_dotenv
+import time
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.requests import HTTPConnection
+
+# orjson serializes responses several times faster than the standard library
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+except ImportError:
+    FastJSONResponse = JSONResponse
 
 # Load environment variables
 load_dotenv()
 
 # Import your data loader and AI orchestration logic
 from src.data_loader import DataLoader
-from src.ai_orchestration import MentalHealthAIOrchestrator
+from src.ai_orchestration import MentalHealthAIOrchestrator, get_ai_engine, ai_engines, aprocess_message_batch
+from src.session_store import SessionStore
+from src.conversation_store import create_conversation_store
+from src.admission import AdmissionController, AdmissionRejected
+from src.rate_limit import RateLimiter, RateLimitDecision, RateLimitExceeded
+from src.compression import CompressionMiddleware
+from src.metrics import metrics, stats_to_gauges
+from src.tracing import TracingMiddleware, current_timings, current_trace_id, reset_timings, log
+from src.kb_cache import kb_cache
+from src.feedback_rollups import get_usage_report
 from src.db_schema import init_db, get_db_session, Problem, Suggestion, SelfAssessment, FeedbackPrompt, NextAction, Feedback, FinetuningExample
+# The Suggestion response model below shadows the table class, so keep an alias for queries
+from src.db_schema import Suggestion as SuggestionRecord
 from sqlalchemy import func
 
+class DefaultResponse(FastJSONResponse):
+    """JSON response whose rendering time shows up as 'serialize' in Server-Timing"""
+
+    def render(self, content: Any) -> bytes:
+        with metrics.timer("response_serialization_seconds"):
+            return super().render(content)
+
 # Initialize database
 current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir)
 db_path = os.path.join(project_root, 'mental_health_kb.db')
 init_db(f'sqlite:///{db_path}')
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start warming up shared resources, serve, then release them on shutdown.
+
+    The server accepts connections straight away so /healthz answers during
+    warm-up; /readyz only reports ready once warm_up() has finished.
+    """
+    await startup_event()
+    warm_up_task = asyncio.create_task(asyncio.to_thread(warm_up))
+    try:
+        yield
+    finally:
+        warm_up_task.cancel()
+        for engine in ai_engines():
+            engine.close()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Mental Health AI Assistant API",
     description="API for the Mental Health AI Assistant with feedback and conversation tracking",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=DefaultResponse
 )
 
 # Add CORS middleware
@@ -39,36 +90,282 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=[
+        "ETag", "X-Next-Cursor", "Retry-After", "RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset",
+        "X-Trace-ID", "Server-Timing"
+    ],
 )
 
-# Initialize database connection pool on startup
-# Note: The startup_event is defined later, ensure it's correctly placed or merged if duplicated.
+# Compress large responses; the SSE stream is excluded so tokens are not buffered
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024")),
+    exclude_paths=["/chat/stream"]
+)
+
+# Outermost, so the trace ID and timings cover everything below
+app.add_middleware(TracingMiddleware)
 
 # Load the knowledge base at startup
 current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir)
 
-# Global cache for AI orchestrators, keyed by session_id
-ai_orchestrators_cache: Dict[str, MentalHealthAIOrchestrator] = {}
+# Configuration for the shared AI engine. The heavy resources (embedding model,
+# vector store, LLM client, DB engine) are built once per process from this config.
+ai_config = {
+    "openai_api_key": os.getenv("OPENAI_API_KEY"),
+    "db_connection_string": f"sqlite:///{os.path.join(project_root, 'mental_health_kb.db')}",
+    "model_name": "ft:gpt-4o-mini-2024-07-18:personal::BgSR6SI0",
+    "vector_db_path": os.path.join(project_root, 'data', 'vector_db'),
+    # Answers to history-free questions similar to one already answered are reused
+    "semantic_cache_threshold": float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+    "semantic_cache_ttl_seconds": float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600")),
+    "semantic_cache_max_entries": int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000")),
+    # Exact repeats of history-free questions are answered from the DB across workers and restarts
+    "response_cache_ttl_seconds": float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400")),
+    "response_cache_max_entries": int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000")),
+    # Query embeddings are cached in memory and on disk; an empty directory keeps them in memory only
+    "embedding_cache_dir": os.getenv("EMBEDDING_CACHE_DIR", os.path.join(project_root, 'data', 'embedding_cache')),
+    "embedding_cache_memory_entries": int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "10000")),
+    "embedding_cache_disk_entries": int(os.getenv("EMBEDDING_CACHE_DISK_ENTRIES", "100000")),
+    # History sent to the condense prompt: recent turns plus a rolling summary, within a token budget
+    "memory_max_tokens": int(os.getenv("MEMORY_MAX_TOKENS", "1500")),
+    "memory_summary_tokens": int(os.getenv("MEMORY_SUMMARY_TOKENS", "300")),
+    # Follow-ups that read as standalone questions skip the condense LLM call
+    "condense_skip_self_contained": os.getenv("CONDENSE_SKIP_SELF_CONTAINED", "true").lower() == "true",
+    # Structured KB questions (problem list, suggestions, self-assessment) are answered from the DB
+    "intent_router_enabled": os.getenv("INTENT_ROUTER_ENABLED", "true").lower() == "true",
+    # Hybrid retrieval fuses BM25 keyword and vector results, so fewer documents are needed per prompt
+    "retrieval_k": int(os.getenv("RETRIEVAL_K", "4")),
+    "hybrid_retrieval": os.getenv("HYBRID_RETRIEVAL", "true").lower() == "true",
+    "hybrid_candidates": int(os.getenv("HYBRID_CANDIDATES", "4")),
+    "keyword_index_check_seconds": float(os.getenv("KEYWORD_INDEX_CHECK_SECONDS", "30"))
+}
+
+# Bounds for the per-session stores; idle sessions are dropped after the TTL
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "1000"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+
+# Conversation history and metadata live in a store shared by all workers
+# (the SQLite DB by default), so any worker can serve any session.
+conversation_store = create_conversation_store(
+    os.getenv("SESSION_BACKEND", "sql"),
+    ttl_seconds=SESSION_TTL_SECONDS
+)
+
+# Per-worker cache of AI orchestrators, keyed by session_id. Each orchestrator
+# only carries its own conversation memory and is revalidated against the
+# conversation store's revision before use.
+ai_orchestrators_cache = SessionStore(
+    max_entries=SESSION_MAX_ENTRIES,
+    ttl_seconds=SESSION_TTL_SECONDS,
+    size_of=lambda orchestrator: orchestrator.memory_size_bytes()
+)
 
 def get_ai_orchestrator_for_session(session_id: Optional[str] = None) -> tuple[MentalHealthAIOrchestrator, str]:
-    """Gets or creates an AI orchestrator for a given session ID."""
-    if session_id and session_id in ai_orchestrators_cache:
-        return ai_orchestrators_cache[session_id], session_id
-
-    new_session_id = session_id or str(uuid.uuid4())
-    config = {
-        "openai_api_key": os.getenv("OPENAI_API_KEY"),
-        "db_connection_string": f"sqlite:///{os.path.join(project_root, 'mental_health_kb.db')}",
-        "model_name": "ft:gpt-4o-mini-2024-07-18:personal::BgSR6SI0",
-        "vector_db_path": os.path.join(project_root, 'data', 'vector_db')
-    }
-    orchestrator = MentalHealthAIOrchestrator(config)
-    ai_orchestrators_cache[new_session_id] = orchestrator
+    """Gets or creates an AI orchestrator for a given session ID.
+
+    Reuses this worker's cached orchestrator when it is up to date with the
+    conversation store, and otherwise rebuilds it from the stored history.
+    """
+    if session_id:
+        revision = conversation_store.revision(session_id) or 0
+        orchestrator = ai_orchestrators_cache.get(session_id)
+        if orchestrator is not None and orchestrator.revision == revision:
+            return orchestrator, session_id
+
+        orchestrator = MentalHealthAIOrchestrator(ai_config, engine=get_ai_engine(ai_config))
+        if revision:
+            state = conversation_store.load(session_id)
+            if state is not None:
+                orchestrator.restore_history(state['history'], state['turn_count'], state['summary'], state['summarized_messages'])
+        orchestrator.memory.on_summary = functools.partial(conversation_store.save_summary, session_id)
+        ai_orchestrators_cache.set(session_id, orchestrator)
+        return orchestrator, session_id
+
+    new_session_id = str(uuid.uuid4())
+    orchestrator = MentalHealthAIOrchestrator(ai_config, engine=get_ai_engine(ai_config))
+    orchestrator.memory.on_summary = functools.partial(conversation_store.save_summary, new_session_id)
+    ai_orchestrators_cache.set(new_session_id, orchestrator)
     return orchestrator, new_session_id
 
-# In-memory session storage (can be removed if orchestrator cache handles session state)
-conversation_sessions = {} # This might be redundant if chat history is managed within orchestrator instances
+# Limits for /chat/batch
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+# Snapshot of the static knowledge base endpoints, invalidated when the KB version changes
+KB_CACHE_MAX_AGE = int(os.getenv("KB_CACHE_MAX_AGE", "60"))
+kb_cache.check_interval = float(os.getenv("KB_VERSION_CHECK_SECONDS", "5"))
+
+def kb_cached_response(request: Request, key: str, loader, paged: bool = False) -> Response:
+    """Serve a KB snapshot value with ETag/If-None-Match and Cache-Control support.
+
+    With paged=True the loader returns {'items': [...], 'next_cursor': ...};
+    the items are the body and the cursor goes in the X-Next-Cursor header.
+    """
+    content, version = kb_cache.get(key, loader)
+    etag = f'"{version}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={KB_CACHE_MAX_AGE}"}
+    if paged:
+        if content['next_cursor']:
+            headers["X-Next-Cursor"] = content['next_cursor']
+        content = content['items']
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        if "*" in candidates or etag in candidates or f"W/{etag}" in candidates:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return DefaultResponse(content=content, headers=headers)
+
+# Admission control: concurrency limits with bounded wait queues. Requests
+# beyond the queue, or waiting longer than the timeout, get a fast 503.
+chat_admission = AdmissionController(
+    "chat",
+    max_concurrency=int(os.getenv("CHAT_MAX_CONCURRENCY", "64")),
+    max_queue=int(os.getenv("CHAT_MAX_QUEUE", "128")),
+    queue_timeout=float(os.getenv("CHAT_QUEUE_TIMEOUT_SECONDS", "10")),
+    retry_after=int(os.getenv("CHAT_RETRY_AFTER_SECONDS", "2"))
+)
+feedback_admission = AdmissionController(
+    "feedback",
+    max_concurrency=int(os.getenv("FEEDBACK_MAX_CONCURRENCY", "16")),
+    max_queue=int(os.getenv("FEEDBACK_MAX_QUEUE", "64")),
+    queue_timeout=float(os.getenv("FEEDBACK_QUEUE_TIMEOUT_SECONDS", "5")),
+    retry_after=int(os.getenv("FEEDBACK_RETRY_AFTER_SECONDS", "1"))
+)
+
+async def admit_chat():
+    """Dependency holding a chat admission slot for the duration of the request."""
+    async with chat_admission.admit():
+        yield
+
+async def admit_feedback():
+    """Dependency holding a feedback admission slot for the duration of the request."""
+    async with feedback_admission.admit():
+        yield
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc), "reason": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+# Per-client rate limits: token buckets keyed by session ID and by client IP,
+# configured per route. They run before admission control, so a client over
+# its limit never takes a slot or a queue position from anyone else.
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "10000"))
+# Reverse proxies in front of the app whose X-Forwarded-For entries are trusted;
+# 0 uses the socket peer address (or uvicorn's --proxy-headers result) as is
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+def rate_limiter_from_env(name: str, prefix: str, rate_per_minute: float, burst: int) -> RateLimiter:
+    """Build a limiter from {prefix}_RATE_PER_MINUTE and {prefix}_RATE_BURST; a rate of 0 disables it."""
+    return RateLimiter(
+        name,
+        rate_per_minute=float(os.getenv(f"{prefix}_RATE_PER_MINUTE", str(rate_per_minute))),
+        burst=int(os.getenv(f"{prefix}_RATE_BURST", str(burst))),
+        max_keys=RATE_LIMIT_MAX_KEYS
+    )
+
+rate_limiters: Dict[str, Dict[str, RateLimiter]] = {
+    "chat": {
+        "session": rate_limiter_from_env("chat_session", "CHAT_SESSION", 20, 10),
+        "ip": rate_limiter_from_env("chat_ip", "CHAT_IP", 60, 30)
+    },
+    "feedback": {
+        "session": rate_limiter_from_env("feedback_session", "FEEDBACK_SESSION", 10, 5),
+        "ip": rate_limiter_from_env("feedback_ip", "FEEDBACK_IP", 30, 15)
+    }
+}
+
+def client_ip(connection: HTTPConnection) -> str:
+    """Client address for per-IP rate limits.
+
+    Behind TRUSTED_PROXY_HOPS proxies, the client is the X-Forwarded-For
+    entry added by the outermost trusted proxy; entries before it can be
+    forged by the client and are ignored.
+    """
+    if TRUSTED_PROXY_HOPS > 0:
+        forwarded = [part.strip() for part in connection.headers.get("x-forwarded-for", "").split(",") if part.strip()]
+        if len(forwarded) >= TRUSTED_PROXY_HOPS:
+            return forwarded[-TRUSTED_PROXY_HOPS]
+    return connection.client.host if connection.client else "unknown"
+
+def rate_limit(route: str):
+    """Build a dependency enforcing the route's per-session and per-IP limits.
+
+    The session ID is read from the JSON body. A batch request costs one
+    token per item, capped at the bucket size. The tightest limit is reported
+    in RateLimit-* headers on the response.
+    """
+    async def dependency(request: Request, response: Response):
+        keys = {"ip": client_ip(request)}
+        cost = 1
+        try:
+            # The body is cached on the request, so this does not read it twice
+            body = await request.json()
+        except Exception:
+            body = None
+        if isinstance(body, dict):
+            if body.get("session_id"):
+                keys["session"] = str(body["session_id"])
+            if isinstance(body.get("items"), list):
+                cost = max(1, len(body["items"]))
+
+        tightest = check_rate_limits(route, keys, cost)
+        if tightest is not None:
+            response.headers.update(tightest.headers())
+
+    return dependency
+
+def check_rate_limits(route: str, keys: Dict[str, str], cost: int = 1) -> Optional[RateLimitDecision]:
+    """Charge each of the route's enabled limiters for its key (scope -> key).
+
+    Raises RateLimitExceeded for the first limit hit, otherwise returns the
+    decision with the fewest remaining tokens (None if all are disabled).
+    Nothing is charged unless every limiter admits the request, so a session
+    over its own limit does not use up the quota of others on its IP.
+    """
+    charges = []
+    for scope, key in keys.items():
+        limiter = rate_limiters[route][scope]
+        if limiter.enabled:
+            charges.append((scope, limiter, key, min(cost, limiter.burst)))
+    for scope, limiter, key, charge in charges:
+        decision = limiter.check(key, charge, dry_run=True)
+        if not decision.allowed:
+            raise RateLimitExceeded(route, scope, decision)
+    tightest = None
+    for scope, limiter, key, charge in charges:
+        decision = limiter.check(key, charge)
+        if tightest is None or decision.remaining < tightest.remaining:
+            tightest = decision
+    return tightest
+
+rate_limit_chat = rate_limit("chat")
+rate_limit_feedback = rate_limit("feedback")
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": str(exc), "scope": exc.scope},
+        headers=exc.decision.headers()
+    )
+
+_kb_orchestrator: Optional[MentalHealthAIOrchestrator] = None
+_kb_orchestrator_lock = threading.Lock()
+
+def get_kb_orchestrator() -> MentalHealthAIOrchestrator:
+    """Gets the orchestrator used for session-less knowledge base and feedback calls."""
+    global _kb_orchestrator
+    if _kb_orchestrator is None:
+        with _kb_orchestrator_lock:
+            if _kb_orchestrator is None:
+                _kb_orchestrator = MentalHealthAIOrchestrator(ai_config, engine=get_ai_engine(ai_config))
+    return _kb_orchestrator
 
 
 # Pydantic models for requests and responses
@@ -81,6 +378,13 @@ class Suggestion(BaseModel):
     suggestion_id: str = Field(..., description="Unique identifier for the suggestion")
     suggestion_text: str = Field(..., description="The suggestion text")
     problem_id: Optional[str] = Field(None, description="ID of the related problem")
+    problem_name: Optional[str] = Field(None, description="Name of the related problem")
+    resource_link: Optional[str] = Field(None, description="Link to a related resource")
+
+# Fields that /suggestions can return, selectable with the `fields` query parameter
+SUGGESTION_FIELDS = ("suggestion_id", "suggestion_text", "problem_id", "problem_name", "resource_link")
+
+SOURCE_MODE_PATTERN = "^(full|ids)$"
 
 class ChatRequest(BaseModel):
     message: str = Field(..., description="User's message")
@@ -89,6 +393,11 @@ class ChatRequest(BaseModel):
         None,
         description="Additional context for the conversation"
     )
+    source_mode: str = Field(
+        "full",
+        pattern=SOURCE_MODE_PATTERN,
+        description="'full' returns source document content; 'ids' returns only IDs and scores (fetch content from /documents/{id})"
+    )
 
 class ChatResponse(BaseModel):
     response: str = Field(..., description="AI's response")
@@ -98,6 +407,23 @@ class ChatResponse(BaseModel):
         description="Additional metadata about the response"
     )
 
+class BatchChatItem(BaseModel):
+    message: str = Field(..., description="User's message")
+    session_id: Optional[str] = Field(None, description="Session ID for conversation tracking")
+
+class BatchChatRequest(BaseModel):
+    items: List[BatchChatItem] = Field(..., description="Messages to process, in order")
+    source_mode: str = Field("full", pattern=SOURCE_MODE_PATTERN, description="'full' or 'ids', as for /chat")
+
+class BatchChatResult(BaseModel):
+    session_id: str = Field(..., description="Session ID the message was processed in")
+    response: Optional[str] = Field(None, description="AI's response, if processing succeeded")
+    metadata: Optional[Dict[str, Any]] = Field(None, description="Additional metadata about the response")
+    error: Optional[str] = Field(None, description="Error message, if processing failed")
+
+class BatchChatResponse(BaseModel):
+    results: List[BatchChatResult] = Field(..., description="One result per request item, in request order")
+
 class FeedbackRequest(BaseModel):
     feedback: str = Field(..., description="User's feedback text")
     session_id: str = Field(..., description="Session ID for conversation tracking")
@@ -123,190 +449,183 @@ async def root():
     }
 
 @app.get("/kb-stats", tags=["Knowledge Base"])
-async def get_kb_stats(): # Removed AI orchestrator dependency
+def get_kb_stats(request: Request): # Removed AI orchestrator dependency
     """Get knowledge base statistics"""
-    try:
-        with get_db_session() as session:
+    def load_stats():
+        with metrics.timer("db_read_seconds", operation="kb_stats"), get_db_session() as session:
             # Defensive: handle missing tables gracefully
             def safe_count(query_func):
                 try:
                     return query_func()
                 except Exception:
                     return 0
-            stats = {
+            return {
                 "last_updated": datetime.utcnow().isoformat(),
                 "problems_count": safe_count(lambda: session.query(func.count(Problem.problem_id)).scalar() or 0),
-                "suggestions_count": safe_count(lambda: session.query(func.count(Suggestion.suggestion_id)).scalar() or 0),
+                "suggestions_count": safe_count(lambda: session.query(func.count(SuggestionRecord.suggestion_id)).scalar() or 0),
                 "assessments_count": safe_count(lambda: session.query(func.count(SelfAssessment.question_id)).scalar() or 0),
                 "feedback_prompts_count": safe_count(lambda: session.query(func.count(FeedbackPrompt.prompt_id)).scalar() or 0),
                 "next_actions_count": safe_count(lambda: session.query(func.count(NextAction.action_id)).scalar() or 0),
                 "finetuning_examples_count": safe_count(lambda: session.query(func.count(FinetuningExample.id)).scalar() or 0)
             }
-            return stats
+
+    try:
+        return kb_cached_response(request, "kb-stats", load_stats)
     except Exception as e:
-        print(f"Error in /kb-usage-report endpoint: {str(e)}")
-        print(f"Error type: {type(e).__name__}")
+        log(f"Error in /kb-stats endpoint: {str(e)}")
+        log(f"Error type: {type(e).__name__}")
         import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        log(f"Traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/kb-usage-report", tags=["Knowledge Base"])
-async def get_kb_usage_report(): # Removed AI orchestrator dependency
+def get_kb_usage_report(): # Removed AI orchestrator dependency
     """Get knowledge base usage statistics and analysis"""
     try:
-        with get_db_session() as session:
-            # Get problem usage statistics based on feedback
-            problem_usage = session.query(
-                Problem.problem_id,
-                Problem.problem_name,
-                func.count(Feedback.id).label('usage_count')
-            ).outerjoin(
-                Feedback,
-                Problem.problem_id == Feedback.problem_id
-            ).group_by(
-                Problem.problem_id,
-                Problem.problem_name
-            ).all()
-
-            # Get suggestion effectiveness
-            suggestion_effectiveness = session.query(
-                Suggestion.suggestion_id,
-                Suggestion.suggestion_text,
-                func.avg(Feedback.feedback_sentiment).label('average_rating'),
-                func.count(Feedback.id).label('total_uses')
-            ).outerjoin(
-                Feedback,
-                Suggestion.suggestion_id == Feedback.suggestion_id
-            ).group_by(
-                Suggestion.suggestion_id,
-                Suggestion.suggestion_text
-            ).all()
-
-            # Get feedback sentiment distribution
-            total_feedback = session.query(func.count(Feedback.id)).scalar() or 1
-            feedback_sentiment = session.query(
-                Feedback.feedback_sentiment,
-                func.count(Feedback.id).label('count')
-            ).group_by(
-                Feedback.feedback_sentiment
-            ).all()
-
-            # Format the response
-            report = {
-                "problem_usage": [
-                    {
-                        "problem_id": str(p_id),
-                        "problem_name": p_name,
-                        "usage_count": int(p_count)
-                    }
-                    for p_id, p_name, p_count in problem_usage
-                ],
-                "suggestion_effectiveness": [
-                    {
-                        "suggestion_id": str(s_id) if s_id is not None else None, # Ensure None is handled explicitly
-                        "suggestion_text": s_text if s_text is not None else "",
-                        "average_rating": float(s_rating) if s_rating is not None else 0.0,
-                        "total_uses": int(s_uses) if s_uses is not None else 0
-                    }
-                    for s_id, s_text, s_rating, s_uses in suggestion_effectiveness
-                ],
-                "feedback_sentiment": [
-                    {
-                        "sentiment": float(sentiment) if sentiment is not None else 0.0,
-                        "count": int(count) if count is not None else 0,
-                        "percentage": float(count or 0) / total_feedback
-                    }
-                    for sentiment, count in feedback_sentiment
-                ],
-                "sync_history": [
-                    {
-                        "timestamp": datetime.utcnow().isoformat(),
-                        "description": "Initial knowledge base statistics"
-                    }
-                ]
-            }
+        with metrics.timer("db_read_seconds", operation="kb_usage_report"), get_db_session() as session:
+            # Read only the feedback rollups maintained by store_feedback
+            report = get_usage_report(session)
+            report["sync_history"] = [
+                {
+                    "timestamp": datetime.utcnow().isoformat(),
+                    "description": "Initial knowledge base statistics"
+                }
+            ]
             return JSONResponse(content=report)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/problems", response_model=List[ProblemResponse], tags=["Knowledge Base"])
-async def get_problems(session_id: Optional[str] = Depends(lambda: None), ai_tuple: tuple = Depends(get_ai_orchestrator_for_session)):
-    ai, _ = ai_tuple
+def get_problems(request: Request, session_id: Optional[str] = Depends(lambda: None), ai: MentalHealthAIOrchestrator = Depends(get_kb_orchestrator)):
     """Get list of all available mental health problems"""
-    try:
-        problems = ai.get_problem_list()
-        return [
+    def load_problems():
+        return jsonable_encoder([
             ProblemResponse(
                 problem_id=p['id'], # Assuming 'id' from ai.get_problem_list() maps to problem_id
                 problem_name=p['name'],
                 description=p.get('description') # Use .get() for optional fields
-            ) for p in problems
-        ]
+            ) for p in ai.get_problem_list()
+        ])
+
+    try:
+        return kb_cached_response(request, "problems", load_problems)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def encode_cursor(suggestion_id: str) -> str:
+    return base64.urlsafe_b64encode(suggestion_id.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+    except (binascii.Error, UnicodeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
 @app.get("/suggestions", response_model=List[Suggestion], tags=["Knowledge Base"])
-async def get_suggestions(problem_id: Optional[str] = None, session_id: Optional[str] = Depends(lambda: None), ai_tuple: tuple = Depends(get_ai_orchestrator_for_session)):
-    ai, _ = ai_tuple
-    """Get suggestions, optionally filtered by problem ID"""
+def get_suggestions(
+    request: Request,
+    problem_id: Optional[List[str]] = Query(None, description="Problem ID filter; repeat or comma-separate for several"),
+    cursor: Optional[str] = Query(None, description="Cursor from a previous page's X-Next-Cursor header"),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Page size; all matching suggestions if omitted"),
+    fields: Optional[str] = Query(None, description=f"Comma-separated subset of: {', '.join(SUGGESTION_FIELDS)}"),
+    session_id: Optional[str] = Depends(lambda: None),
+    ai: MentalHealthAIOrchestrator = Depends(get_kb_orchestrator)
+):
+    """Get suggestions, optionally filtered by one or more problem IDs.
+
+    The whole listing is one joined query. Pass `limit` to page through it;
+    the cursor for the next page is returned in the X-Next-Cursor header.
+    """
+    problem_ids = sorted({pid.strip() for value in (problem_id or []) for pid in value.split(",") if pid.strip()})
+    selected_fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else list(SUGGESTION_FIELDS)
+    unknown_fields = [f for f in selected_fields if f not in SUGGESTION_FIELDS]
+    if unknown_fields:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown_fields)}"
+        )
+    after = decode_cursor(cursor) if cursor else None
+
+    def load_suggestions():
+        suggestions, next_after = ai.list_suggestions(problem_ids=problem_ids or None, after=after, limit=limit)
+        items = []
+        for s in suggestions:
+            row = {
+                "suggestion_id": s['id'],
+                "suggestion_text": s['text'],
+                "problem_id": s['problem_id'],
+                "problem_name": s['problem_name'],
+                "resource_link": s['resource']
+            }
+            items.append({field: row[field] for field in selected_fields})
+        return {"items": items, "next_cursor": encode_cursor(next_after) if next_after else None}
+
+    key = f"suggestions:{','.join(problem_ids) or '*'}:{after or ''}:{limit or ''}:{','.join(selected_fields)}"
     try:
-        if problem_id:
-            suggestions = ai.get_suggestions(problem_id)
-        else:
-            # Get all suggestions if no problem_id is provided
-            problems = ai.get_problem_list()
-            all_suggestions = []
-            for problem in problems:
-                all_suggestions.extend(ai.get_suggestions(problem['id']))
-            suggestions = all_suggestions
-
-        return [
-            Suggestion(
-                suggestion_id=s['id'],
-                suggestion_text=s['text'],
-                problem_id=s.get('problem_id')
-            ) for s in suggestions
-        ]
+        return kb_cached_response(request, key, load_suggestions, paged=True)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# Thread pool for CPU-bound tasks
-thread_pool = ThreadPoolExecutor(max_workers=4)
+def record_session_turn(
+    orchestrator: MentalHealthAIOrchestrator,
+    session_id: str,
+    context: Optional[Dict[str, Any]],
+    response_data: Dict[str, Any]
+) -> None:
+    """Persist a completed chat turn to the shared conversation store."""
+    previous = orchestrator.revision
+    revision = conversation_store.append_turn(
+        session_id,
+        orchestrator.next_unpersisted_turn(),
+        initial_context=context,
+        context_update=response_data.get('context') # Assuming response_data might update context
+    )
+    # Any other revision means another worker appended turns this memory
+    # never saw; -1 never matches the store, so the next request reloads it
+    orchestrator.revision = revision if revision == previous + 1 else -1
+    # The conversation memory grew, so refresh its accounted size
+    ai_orchestrators_cache.resize(session_id)
+
+def format_sources(source_documents: List[Dict[str, Any]], source_mode: str) -> List[Dict[str, Any]]:
+    """Shape source documents for a response; 'ids' mode drops content and metadata."""
+    if source_mode == "ids":
+        return [{'id': doc['id'], 'score': doc['score']} for doc in source_documents]
+    return source_documents
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.get("/documents/{document_id}", tags=["Knowledge Base"])
+def get_document(document_id: str):
+    """Get the full content of a retrieved source document by ID"""
+    try:
+        document = get_ai_engine(ai_config).get_document(document_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if document is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+    # IDs are assigned when the vector index is built, so content under an ID never changes
+    return DefaultResponse(content=document, headers={"Cache-Control": f"public, max-age={KB_CACHE_MAX_AGE}"})
 
 @app.post("/chat", response_model=ChatResponse, tags=["Conversation"])
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, _limited: None = Depends(rate_limit_chat), _admitted: None = Depends(admit_chat)):
     """Process a user message and return an AI response asynchronously."""
-    print(f"Received chat request: session_id={request.session_id}, message='{request.message[:50]}...' ") # Log incoming request
+    log(f"Received chat request: session_id={request.session_id}, message='{request.message[:50]}...' ") # Log incoming request
     try:
-        orchestrator, session_id_to_use = get_ai_orchestrator_for_session(request.session_id)
-        print(f"Using session_id: {session_id_to_use} for orchestrator.")
-
-        # Process the message in a thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        print(f"Processing message for session_id: {session_id_to_use}...")
-        response_data = await loop.run_in_executor(
-            thread_pool,
-            lambda: orchestrator.process_user_message(
-                user_id=session_id_to_use, # Use the consistent session ID
-                message=request.message
-            )
+        # Session lookups hit the shared store, so keep them off the event loop
+        orchestrator, session_id_to_use = await asyncio.to_thread(get_ai_orchestrator_for_session, request.session_id)
+        log(f"Using session_id: {session_id_to_use} for orchestrator.")
+
+        # The async pipeline awaits the LLM natively, so no worker thread is held per chat
+        log(f"Processing message for session_id: {session_id_to_use}...")
+        response_data = await orchestrator.aprocess_user_message(
+            user_id=session_id_to_use, # Use the consistent session ID
+            message=request.message
         )
-        print(f"Successfully processed message for session_id: {session_id_to_use}. Response text: '{response_data.get('text', '')[:50]}...' ")
-
-        # If conversation_sessions is still used for other metadata, update it here.
-        # Otherwise, this block might be removable if all session state is in the orchestrator.
-        if session_id_to_use not in conversation_sessions:
-            conversation_sessions[session_id_to_use] = {
-                'created_at': datetime.utcnow(),
-                'updated_at': datetime.utcnow(),
-                'message_count': 0,
-                'context': request.context or {}
-            }
-        session_meta = conversation_sessions[session_id_to_use]
-        session_meta['updated_at'] = datetime.utcnow()
-        session_meta['message_count'] += 1
-        if 'context' in response_data: # Assuming response_data might update context
-            session_meta['context'].update(response_data['context'])
+        log(f"Successfully processed message for session_id: {session_id_to_use}. Response text: '{response_data.get('text', '')[:50]}...' ")
+
+        await asyncio.to_thread(record_session_turn, orchestrator, session_id_to_use, request.context, response_data)
 
         chat_response_obj = ChatResponse(
             response=response_data['text'],
@@ -315,22 +634,264 @@ async def chat(request: ChatRequest):
                 'next_action': response_data.get('next_action'),
                 'sentiment': response_data.get('sentiment'),
                 'key_phrases': response_data.get('key_phrases', []),
-                'source_documents': response_data.get('source_documents', [])
+                'intent': response_data.get('intent'),
+                'suggestions': response_data.get('suggestions', []),
+                'source_documents': format_sources(response_data.get('source_documents', []), request.source_mode)
             }
         )
-        print(f"Sending chat response for session_id: {session_id_to_use}. Metadata: {chat_response_obj.metadata}")
+        log(f"Sending chat response for session_id: {session_id_to_use}. Metadata: {chat_response_obj.metadata}")
         return chat_response_obj
 
     except Exception as e:
-        print(f"Error in /chat endpoint for session_id={request.session_id}: {str(e)}") # Log error
+        log(f"Error in /chat endpoint for session_id={request.session_id}: {str(e)}") # Log error
+        metrics.increment("errors_total", stage="chat")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error processing message: {str(e)}"
+        )
+
+async def stream_chat_turn(
+    orchestrator: MentalHealthAIOrchestrator,
+    session_id: str,
+    message: str,
+    context: Optional[Dict[str, Any]],
+    source_mode: str
+):
+    """Stream one chat turn's events and persist the turn once it is done."""
+    async for event in orchestrator.astream_user_message(user_id=session_id, message=message):
+        if event['event'] == 'done':
+            await asyncio.to_thread(record_session_turn, orchestrator, session_id, context, event['data'])
+            # Headers went out before the work was done, so report timings in the final event
+            event['data']['trace_id'] = current_trace_id()
+            event['data']['server_timing'] = current_timings()
+        elif event['event'] == 'sources':
+            event['data']['source_documents'] = format_sources(event['data']['source_documents'], source_mode)
+        yield event
+
+class ReleasingStreamingResponse(StreamingResponse):
+    """Streaming response that calls ``release`` once it has been sent or has failed.
+
+    A generator's ``finally`` only runs if the body is iterated, which never
+    happens when the client disconnects before the response starts.
+    """
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+@app.post("/chat/stream", tags=["Conversation"])
+async def chat_stream(request: ChatRequest, _limited: None = Depends(rate_limit_chat)):
+    """Process a user message and stream the response as Server-Sent Events.
+
+    Events, in order: 'session' (session ID), 'sources' (retrieved source
+    documents), one 'token' per generated chunk, then 'done' with the full
+    answer. An 'error' event is sent instead if processing fails.
+    """
+    log(f"Received streaming chat request: session_id={request.session_id}, message='{request.message[:50]}...' ")
+    # The slot must be held until the stream finishes, which is after this
+    # handler returns, so it is released when the response itself completes.
+    await chat_admission.acquire()
+    try:
+        orchestrator, session_id_to_use = await asyncio.to_thread(get_ai_orchestrator_for_session, request.session_id)
+    except Exception as e:
+        chat_admission.release()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error processing message: {str(e)}"
         )
 
+    async def event_stream():
+        try:
+            yield format_sse('session', {'session_id': session_id_to_use})
+            async for event in stream_chat_turn(orchestrator, session_id_to_use, request.message, request.context, request.source_mode):
+                yield format_sse(event['event'], event['data'])
+        except Exception as e:
+            log(f"Error in /chat/stream endpoint for session_id={session_id_to_use}: {str(e)}")
+            metrics.increment("errors_total", stage="chat_stream")
+            yield format_sse('error', {'detail': f"Error processing message: {str(e)}"})
+
+    try:
+        return ReleasingStreamingResponse(
+            event_stream(),
+            release=chat_admission.release,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    except Exception:
+        chat_admission.release()
+        raise
+
+# A follow-up feedback prompt is pushed over the WebSocket after every N turns
+WS_FEEDBACK_PROMPT_EVERY = int(os.getenv("WS_FEEDBACK_PROMPT_EVERY", "3"))
+
+def get_cached_feedback_prompt(stage: str) -> Dict[str, str]:
+    """Get the feedback prompt for a stage from the KB snapshot."""
+    prompt, _ = kb_cache.get(f"feedback_prompt:{stage}", lambda: get_kb_orchestrator().get_feedback_prompt(stage))
+    return prompt
+
+async def ws_send(websocket: WebSocket, event: str, data: Dict[str, Any]) -> None:
+    await websocket.send_text(json.dumps({'event': event, 'data': data}, default=str))
+
+async def ws_chat_turn(websocket: WebSocket, orchestrator: MentalHealthAIOrchestrator, session_id: str, payload: Dict[str, Any]) -> None:
+    """Stream one chat turn over the WebSocket, then push a follow-up feedback prompt when due."""
+    message = payload.get('message')
+    if not isinstance(message, str) or not message.strip():
+        await ws_send(websocket, 'error', {'detail': "'message' must be a non-empty string"})
+        return
+    source_mode = payload.get('source_mode', 'full')
+    if source_mode not in ('full', 'ids'):
+        await ws_send(websocket, 'error', {'detail': "'source_mode' must be 'full' or 'ids'"})
+        return
+
+    # The connection lives across many turns, so give each turn its own timing breakdown
+    reset_timings()
+    await chat_admission.acquire()
+    try:
+        async for event in stream_chat_turn(orchestrator, session_id, message, payload.get('context'), source_mode):
+            await ws_send(websocket, event['event'], event['data'])
+    finally:
+        chat_admission.release()
+
+    if WS_FEEDBACK_PROMPT_EVERY and orchestrator.revision % WS_FEEDBACK_PROMPT_EVERY == 0:
+        await ws_send(websocket, 'feedback_prompt', await asyncio.to_thread(get_cached_feedback_prompt, 'follow_up'))
+
+async def ws_feedback(websocket: WebSocket, session_id: str, payload: Dict[str, Any]) -> None:
+    """Store feedback sent over the WebSocket and reply with the result."""
+    feedback = payload.get('feedback')
+    if not isinstance(feedback, str) or not feedback.strip():
+        await ws_send(websocket, 'error', {'detail': "'feedback' must be a non-empty string"})
+        return
+    async with feedback_admission.admit():
+        result = await asyncio.to_thread(
+            get_kb_orchestrator().process_feedback,
+            feedback=feedback,
+            context=payload.get('context') or {},
+            user_id=session_id,
+            user_message=payload.get('user_message'),
+            ai_response=payload.get('ai_response'),
+            problem_id=payload.get('problem_id'),
+            suggestion_id=payload.get('suggestion_id')
+        )
+    await ws_send(websocket, 'feedback_result', {
+        'message': result['text'],
+        'feedback_id': result.get('feedback_id', ''),
+        'sentiment': result.get('sentiment', 'neutral'),
+        'next_action': result.get('next_action', 'A01')
+    })
+
+@app.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket, session_id: Optional[str] = None):
+    """Chat over a WebSocket bound to one session for the connection's lifetime.
+
+    The session is resolved once on connect instead of per message. Client
+    frames are JSON objects with a 'type':
+
+    - {"type": "message", "message": ..., "context": {...}, "source_mode": "full" | "ids"}
+    - {"type": "feedback", "feedback": ..., "user_message": ..., "ai_response": ..., "problem_id": ..., "suggestion_id": ...}
+    - {"type": "ping"}
+
+    Server frames are {"event": ..., "data": {...}} with events 'session',
+    'feedback_prompt', 'sources', 'token', 'done', 'feedback_result', 'pong'
+    and 'error'. Turns are processed one at a time, in order.
+    """
+    await websocket.accept()
+    websocket_ip = client_ip(websocket)
+    try:
+        orchestrator, session_id = await asyncio.to_thread(get_ai_orchestrator_for_session, session_id)
+        await ws_send(websocket, 'session', {'session_id': session_id})
+        if orchestrator.revision == 0:
+            await ws_send(websocket, 'feedback_prompt', await asyncio.to_thread(get_cached_feedback_prompt, 'initial'))
+
+        while True:
+            frame = await websocket.receive_text()
+            try:
+                payload = json.loads(frame)
+                kind = payload.get('type') if isinstance(payload, dict) else None
+                if kind == 'message':
+                    check_rate_limits("chat", {"ip": websocket_ip, "session": session_id})
+                    # Pick up turns another worker appended since the last one
+                    orchestrator, _ = await asyncio.to_thread(get_ai_orchestrator_for_session, session_id)
+                    await ws_chat_turn(websocket, orchestrator, session_id, payload)
+                elif kind == 'feedback':
+                    check_rate_limits("feedback", {"ip": websocket_ip, "session": session_id})
+                    await ws_feedback(websocket, session_id, payload)
+                elif kind == 'ping':
+                    await ws_send(websocket, 'pong', {})
+                else:
+                    await ws_send(websocket, 'error', {'detail': "'type' must be 'message', 'feedback' or 'ping'"})
+            except ValueError:
+                await ws_send(websocket, 'error', {'detail': "Frames must be JSON objects"})
+            except RateLimitExceeded as e:
+                await ws_send(websocket, 'error', {'detail': str(e), 'scope': e.scope, 'retry_after': e.decision.retry_after})
+            except AdmissionRejected as e:
+                await ws_send(websocket, 'error', {'detail': str(e), 'reason': e.reason, 'retry_after': e.retry_after})
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                log(f"Error in /ws/chat for session_id={session_id}: {str(e)}")
+                metrics.increment("errors_total", stage="chat_websocket")
+                await ws_send(websocket, 'error', {'detail': f"Error processing message: {str(e)}"})
+    except WebSocketDisconnect:
+        pass
+
+@app.post("/chat/batch", response_model=BatchChatResponse, tags=["Conversation"])
+async def chat_batch(request: BatchChatRequest, _limited: None = Depends(rate_limit_chat), _admitted: None = Depends(admit_chat)):
+    """Process many messages in one call, e.g. for QA replays and offline evaluation.
+
+    Queries are embedded in one batched call and LLM calls fan out with
+    bounded concurrency. Results come back in request order; a failing item
+    carries an error instead of failing the whole batch.
+    """
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Batch too large: {len(request.items)} items (max {BATCH_MAX_ITEMS})"
+        )
+    log(f"Received batch chat request with {len(request.items)} items")
+    try:
+        resolved = await asyncio.to_thread(lambda: [get_ai_orchestrator_for_session(item.session_id) for item in request.items])
+        outputs = await aprocess_message_batch(
+            get_ai_engine(ai_config),
+            [(orchestrator, session_id, item.message) for (orchestrator, session_id), item in zip(resolved, request.items)],
+            max_concurrency=BATCH_MAX_CONCURRENCY
+        )
+    except Exception as e:
+        log(f"Error in /chat/batch endpoint: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error processing batch: {str(e)}"
+        )
+
+    results = []
+    for (orchestrator, session_id), item, output in zip(resolved, request.items, outputs):
+        if 'error' in output:
+            results.append(BatchChatResult(session_id=session_id, error=output['error']))
+            continue
+        try:
+            await asyncio.to_thread(record_session_turn, orchestrator, session_id, None, output)
+        except Exception as e:
+            results.append(BatchChatResult(session_id=session_id, error=f"Error saving turn: {str(e)}"))
+            continue
+        results.append(BatchChatResult(
+            session_id=session_id,
+            response=output['text'],
+            metadata={
+                'next_action': output.get('next_action'),
+                'intent': output.get('intent'),
+                'suggestions': output.get('suggestions', []),
+                'source_documents': format_sources(output.get('source_documents', []), request.source_mode)
+            }
+        ))
+    return BatchChatResponse(results=results)
+
 @app.post("/feedback", response_model=FeedbackResponse, tags=["Feedback"])
-async def submit_feedback(feedback: FeedbackRequest, session_id: Optional[str] = Depends(lambda: None), ai_tuple: tuple = Depends(get_ai_orchestrator_for_session)):
-    ai, _ = ai_tuple
+def submit_feedback(feedback: FeedbackRequest, session_id: Optional[str] = Depends(lambda: None), ai: MentalHealthAIOrchestrator = Depends(get_kb_orchestrator), _limited: None = Depends(rate_limit_feedback), _admitted: None = Depends(admit_feedback)):
     """
     Submit feedback about the AI's response.
 
@@ -361,18 +922,132 @@ async def submit_feedback(feedback: FeedbackRequest, session_id: Optional[str] =
             detail=f"Error processing feedback: {str(e)}"
         )
 
+def collect_component_stats() -> Dict[str, Dict[str, Any]]:
+    """Gather stats from the in-process caches, stores and limiters."""
+    component_stats = {
+        "sessions": conversation_store.stats(),
+        "orchestrators": ai_orchestrators_cache.stats(),
+        "kb_cache": kb_cache.stats(),
+        "chat_admission": chat_admission.stats(),
+        "feedback_admission": feedback_admission.stats()
+    }
+    for route, limiters in rate_limiters.items():
+        for scope, limiter in limiters.items():
+            component_stats[f"rate_limit_{route}_{scope}"] = limiter.stats()
+    for engine in ai_engines():
+        component_stats["single_flight"] = engine.single_flight.stats()
+        component_stats["sentiment_scoring"] = engine.sentiment_scorer.stats()
+        component_stats["semantic_cache"] = engine.semantic_cache.stats()
+        component_stats["response_cache"] = engine.response_cache.stats()
+        component_stats["embedding_cache"] = engine.embeddings.stats()
+    return component_stats
+
+@app.get("/metrics", tags=["Operations"])
+async def get_metrics(format: str = Query("prometheus", pattern="^(prometheus|json)$")):
+    """Get per-stage latency histograms, counters and component stats.
+
+    Returns the Prometheus text format by default, or JSON with format=json.
+    """
+    # Some component stats count rows in the DB, so keep them off the event loop
+    component_stats = await asyncio.to_thread(collect_component_stats)
+    if format == "json":
+        return {**metrics.snapshot(), "components": component_stats}
+    gauges = {}
+    for component, stats in component_stats.items():
+        gauges.update(stats_to_gauges(component, stats))
+    return Response(content=metrics.render_prometheus(gauges), media_type="text/plain; version=0.0.4")
+
+@app.get("/admission/stats", tags=["Operations"])
+async def get_admission_stats():
+    """Get admission control and rate limit statistics (active requests, queue depth, wait times, rejections)"""
+    return {
+        "chat": chat_admission.stats(),
+        "feedback": feedback_admission.stats(),
+        "rate_limits": {
+            route: {scope: limiter.stats() for scope, limiter in limiters.items()}
+            for route, limiters in rate_limiters.items()
+        }
+    }
+
+@app.get("/sessions/stats", tags=["Sessions"])
+def get_session_stats():
+    """Get session store statistics (stored sessions, this worker's cache hits, evictions, resident bytes)"""
+    ai_orchestrators_cache.purge_expired()
+    conversation_store.purge_expired()
+    return {
+        "orchestrators": ai_orchestrators_cache.stats(),
+        "sessions": conversation_store.stats()
+    }
+
 @app.get("/sessions/{session_id}", tags=["Sessions"])
-async def get_session(session_id: str):
+def get_session(session_id: str):
     """Get information about a conversation session"""
-    if session_id not in conversation_sessions:
+    state = conversation_store.load(session_id)
+    if state is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Session not found"
         )
-    return conversation_sessions[session_id]
+    return {
+        'created_at': state['created_at'],
+        'updated_at': state['updated_at'],
+        'message_count': state['turn_count'],
+        'context': state['context']
+    }
+
+# Warm-up state reported by /readyz
+WARMUP_QUERIES = [
+    "I have been feeling anxious lately",
+    "I can't sleep at night"
+]
+readiness: Dict[str, Any] = {
+    "ready": False,
+    "checks": {},
+    "error": None,
+    "warm_up_seconds": None
+}
+
+def warm_up() -> None:
+    """Load the shared AI engine and prime the DB pool, KB cache, embedding model and vector index."""
+    started = time.perf_counter()
+    checks = readiness["checks"]
+    try:
+        # Builds the engine: embedding model load, test embedding, Chroma open
+        engine = get_ai_engine(ai_config)
+        checks["ai_engine"] = "ok"
+
+        checks["kb_version"] = kb_cache.version()
+        get_kb_orchestrator().get_problem_list()
+        checks["database"] = "ok"
+
+        documents = engine.warm_up(WARMUP_QUERIES)
+        checks["vector_search"] = f"ok ({documents} documents)"
+
+        # Also resumes scoring of feedback left unscored by a previous run
+        engine.sentiment_scorer.start()
+        checks["sentiment_scoring"] = "ok"
+
+        readiness["warm_up_seconds"] = round(time.perf_counter() - started, 3)
+        readiness["ready"] = True
+        print(f"Warm-up finished in {readiness['warm_up_seconds']}s, ready to serve")
+    except Exception as e:
+        readiness["error"] = str(e)
+        print(f"Error during warm-up: {e}")
+
+@app.get("/healthz", tags=["Operations"])
+async def healthz():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "ok"}
+
+@app.get("/readyz", tags=["Operations"])
+async def readyz():
+    """Readiness probe: 200 once warm-up has finished, 503 before that or if it failed"""
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if readiness["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"status": "ready" if readiness["ready"] else "warming_up" if readiness["error"] is None else "failed", **readiness}
+    )
 
-# Add startup event to initialize the database tables
-@app.on_event("startup")
+# Called from the lifespan handler to initialize the database tables
 async def startup_event():
     """Initialize database and other resources on startup"""
     try:
@@ -0,0 +1,30 @@
+from typing import Iterable
+from starlette.middleware.gzip import GZipMiddleware
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+
+class CompressionMiddleware:
+    """Compress HTTP responses larger than ``minimum_size`` bytes.
+
+    Uses brotli when brotli-asgi is installed and the client accepts it,
+    falling back to gzip. Paths in ``exclude_paths`` (e.g. Server-Sent Events
+    streams, which a compressor would buffer) are passed through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, exclude_paths: Iterable[str] = ()):
+        self.app = app
+        self.exclude_paths = set(exclude_paths)
+        if BrotliMiddleware is not None:
+            self.compressed_app = BrotliMiddleware(app, minimum_size=minimum_size, gzip_fallback=True)
+        else:
+            self.compressed_app = GZipMiddleware(app, minimum_size=minimum_size)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] not in self.exclude_paths:
+            await self.compressed_app(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
@@ -0,0 +1,198 @@
+import threading
+from concurrent.futures import Executor
+from typing import Callable, List, Optional
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from src.tracing import log
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Token count of a text, estimated at 4 characters per token without tiktoken"""
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut a text down to at most max_tokens tokens"""
+    if max_tokens <= 0:
+        return ""
+    if _encoding is not None:
+        tokens = _encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else _encoding.decode(tokens[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def format_chat_history(messages: List[BaseMessage]) -> str:
+    """Render chat messages as 'Human:'/'Assistant:' lines for the condense prompt"""
+    role_prefixes = {"human": "Human", "ai": "Assistant"}
+    return "\n".join(f"{role_prefixes.get(m.type, m.type)}: {m.content}" for m in messages)
+
+
+def message_tokens(message: BaseMessage) -> int:
+    # Content plus the role prefix and newline of its rendered line
+    return count_tokens(str(message.content)) + 4
+
+
+class TokenBudgetMemory:
+    """Conversation memory whose rendered history stays within a token budget.
+
+    The most recent messages are kept verbatim as long as they, together with
+    the summary, fit in ``max_tokens``. Older messages are evicted whole turns
+    at a time and folded into a rolling summary of at most ``summary_tokens``
+    tokens by ``summarize(summary, messages)``, which runs on ``executor`` so
+    the request path never waits for it. Each fold takes at most
+    ``max_tokens`` worth of messages, so its prompt stays bounded too. Until
+    a fold finishes, the evicted messages are simply left out of the prompt.
+    Without a summarizer (or with ``summary_tokens`` of 0) this is a plain
+    sliding window.
+
+    ``summarized_messages`` counts the transcript messages the summary
+    covers (including any dropped by a failed fold); after each fold
+    ``on_summary(summary, summarized_messages)`` is called so the summary
+    can be persisted and restored with load() instead of recomputed.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 1500,
+        summary_tokens: int = 300,
+        summarize: Optional[Callable[[str, List[BaseMessage]], str]] = None,
+        executor: Optional[Executor] = None
+    ):
+        self.max_tokens = max_tokens
+        # The summary never takes more than half the budget
+        self.summary_tokens = min(summary_tokens, max_tokens // 2) if summarize is not None and executor is not None else 0
+        self.summarize = summarize
+        self.executor = executor
+        self._lock = threading.Lock()
+        self.messages: List[BaseMessage] = []
+        self.summary = ""
+        self.summarized_messages = 0
+        self.on_summary: Optional[Callable[[str, int], None]] = None
+        # Evicted messages not yet folded into the summary
+        self._pending: List[BaseMessage] = []
+        self._summarizing = False
+        self.summaries = 0
+        self.summary_failures = 0
+
+    def has_history(self) -> bool:
+        with self._lock:
+            return bool(self.messages or self.summary or self._pending)
+
+    def add_turn(self, question: str, answer: str) -> List[BaseMessage]:
+        """Append a completed turn, evict what no longer fits and return the turn's messages"""
+        turn = [HumanMessage(content=question), AIMessage(content=answer)]
+        with self._lock:
+            self.messages.extend(turn)
+            self._evict_locked()
+        return turn
+
+    def load(self, messages: List[BaseMessage], summary: str = "", summarized_messages: int = 0) -> None:
+        """Replace the memory with a stored summary and the transcript messages it does not cover"""
+        with self._lock:
+            self.messages = list(messages)
+            self.summary = truncate_tokens(summary, self.summary_tokens)
+            self.summarized_messages = summarized_messages
+            self._pending = []
+            self._evict_locked()
+
+    def _window_budget_locked(self) -> int:
+        summary = count_tokens(self.summary) + 4 if self.summary else 0
+        return self.max_tokens - summary
+
+    def _evict_locked(self) -> None:
+        budget = self._window_budget_locked()
+        tokens = sum(message_tokens(m) for m in self.messages)
+        while self.messages and tokens > budget:
+            # Evict a whole turn so the window never starts with an answer
+            evicted = self.messages[:2]
+            del self.messages[:2]
+            tokens -= sum(message_tokens(m) for m in evicted)
+            if self.summary_tokens > 0:
+                self._pending.extend(evicted)
+            else:
+                self.summarized_messages += len(evicted)
+        self._schedule_summary_locked()
+
+    def _schedule_summary_locked(self) -> None:
+        if self._pending and not self._summarizing:
+            self._summarizing = True
+            try:
+                self.executor.submit(self._fold_pending)
+            except RuntimeError:
+                # Executor shut down; keep the window and drop what it evicted
+                self._summarizing = False
+                self.summarized_messages += len(self._pending)
+                self._pending = []
+
+    def _next_batch_locked(self) -> List[BaseMessage]:
+        """The oldest pending messages fitting in the budget, whole turns at a time and at least one turn"""
+        batch: List[BaseMessage] = []
+        tokens = 0
+        for start in range(0, len(self._pending), 2):
+            turn = self._pending[start:start + 2]
+            tokens += sum(message_tokens(m) for m in turn)
+            if batch and tokens > self.max_tokens:
+                break
+            batch.extend(turn)
+        return batch
+
+    def _fold_pending(self) -> None:
+        with self._lock:
+            summary = self.summary
+            batch = self._next_batch_locked()
+        try:
+            new_summary = truncate_tokens(self.summarize(summary, self._fit_batch(batch)).strip(), self.summary_tokens)
+            failed = False
+        except Exception as e:
+            log(f"Error summarizing conversation history, dropping {len(batch)} older messages: {e}")
+            new_summary = summary
+            failed = True
+        saved = None
+        with self._lock:
+            # load() may have replaced the memory while the LLM was running
+            if self._pending[:len(batch)] == batch:
+                self.summary = new_summary
+                self.summarized_messages += len(batch)
+                del self._pending[:len(batch)]
+                if failed:
+                    self.summary_failures += 1
+                else:
+                    self.summaries += 1
+                    saved = (self.summary, self.summarized_messages)
+            self._summarizing = False
+            # A longer summary leaves less room for the window
+            self._evict_locked()
+        if saved is not None and self.on_summary is not None:
+            try:
+                self.on_summary(*saved)
+            except Exception as e:
+                log(f"Error saving conversation summary: {e}")
+
+    def _fit_batch(self, batch: List[BaseMessage]) -> List[BaseMessage]:
+        """Shorten the messages of a single turn longer than the whole budget"""
+        if sum(message_tokens(m) for m in batch) <= self.max_tokens:
+            return batch
+        per_message = max(1, self.max_tokens // len(batch) - 4)
+        return [m.__class__(content=truncate_tokens(str(m.content), per_message)) for m in batch]
+
+    def render(self) -> str:
+        """The history as 'Human:'/'Assistant:' lines, preceded by the summary if any"""
+        with self._lock:
+            summary = self.summary
+            messages = list(self.messages)
+        parts = [f"Summary of earlier conversation: {summary}"] if summary else []
+        if messages:
+            parts.append(format_chat_history(messages))
+        return "\n".join(parts)
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            messages = self.messages + self._pending
+            return len(self.summary.encode('utf-8')) + sum(256 + len(str(m.content).encode('utf-8')) for m in messages)
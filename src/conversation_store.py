@@ -0,0 +1,302 @@
+import json
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy.exc import IntegrityError
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from src.metrics import metrics
+from src.db_schema import get_db_session, ConversationState
+
+# One-letter role codes keep the stored history small
+ROLE_CODES = {'human': 'h', 'ai': 'a', 'system': 's'}
+MESSAGE_TYPES = {'h': HumanMessage, 'a': AIMessage, 's': SystemMessage}
+
+
+def encode_messages(messages: List[BaseMessage]) -> List[List[str]]:
+    """Turn chat messages into [role, content] pairs"""
+    return [[ROLE_CODES.get(m.type, 'h'), str(m.content)] for m in messages]
+
+
+def serialize_history(pairs: List[List[str]]) -> str:
+    return json.dumps(pairs, ensure_ascii=False, separators=(',', ':'))
+
+
+def deserialize_history(data: Optional[str], start: int = 0) -> List[BaseMessage]:
+    """Rebuild chat messages from a serialized history, skipping the first ``start``"""
+    return [MESSAGE_TYPES.get(role, HumanMessage)(content=content) for role, content in json.loads(data or '[]')[start:]]
+
+
+class ConversationStore(ABC):
+    """Conversation history and metadata shared by every API worker.
+
+    Each session holds its chat history, a turn counter used as a revision,
+    the client context, timestamps and the rolling summary of its oldest
+    messages. Sessions idle for longer than ``ttl_seconds`` are treated as
+    missing and removed by purge_expired().
+    """
+
+    # Backend name reported in stats, set by each subclass
+    backend: str
+
+    def __init__(self, ttl_seconds: Optional[float] = 1800):
+        self.ttl_seconds = ttl_seconds
+        self.loads = 0
+        self.saves = 0
+        self.conflicts = 0
+
+    def _expired_before(self) -> Optional[datetime]:
+        if self.ttl_seconds is None:
+            return None
+        return datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+
+    def _is_expired(self, updated_at: Optional[datetime]) -> bool:
+        cutoff = self._expired_before()
+        return cutoff is not None and updated_at is not None and updated_at < cutoff
+
+    @abstractmethod
+    def revision(self, session_id: str) -> Optional[int]:
+        """Return the stored turn count of a live session, or None"""
+
+    @abstractmethod
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return a live session's metadata, summary and the history messages the summary does not cover, or None"""
+
+    @abstractmethod
+    def append_turn(
+        self,
+        session_id: str,
+        messages: List[BaseMessage],
+        initial_context: Optional[Dict[str, Any]] = None,
+        context_update: Optional[Dict[str, Any]] = None
+    ) -> int:
+        """Append one turn's messages to a session, creating it if needed, and return the new revision"""
+
+    @abstractmethod
+    def save_summary(self, session_id: str, summary: str, summarized_messages: int) -> None:
+        """Store a rolling summary of the first ``summarized_messages`` history messages.
+
+        An older summary never replaces one that covers more messages. The
+        revision is unchanged, since no turn was added.
+        """
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        """Remove a session"""
+
+    @abstractmethod
+    def purge_expired(self) -> int:
+        """Remove idle sessions and return how many were removed"""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of stored sessions"""
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'backend': self.backend,
+            'sessions': self.count(),
+            'ttl_seconds': self.ttl_seconds,
+            'loads': self.loads,
+            'saves': self.saves,
+            'conflicts': self.conflicts
+        }
+
+
+class SQLConversationStore(ConversationStore):
+    """Conversation store backed by the conversation_states table.
+
+    Turns are appended with optimistic concurrency on the turn counter, so two
+    workers writing the same session at once both keep their turn.
+    """
+
+    backend = 'sql'
+
+    def __init__(self, ttl_seconds: Optional[float] = 1800, session_scope: Callable = get_db_session, max_retries: int = 5):
+        super().__init__(ttl_seconds)
+        self.session_scope = session_scope
+        self.max_retries = max_retries
+
+    def revision(self, session_id: str) -> Optional[int]:
+        with metrics.timer("db_read_seconds", operation="session_revision"), self.session_scope() as session:
+            row = session.query(ConversationState.turn_count, ConversationState.updated_at).filter_by(session_id=session_id).first()
+        if row is None or self._is_expired(row.updated_at):
+            return None
+        return row.turn_count
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with metrics.timer("db_read_seconds", operation="session_load"), self.session_scope() as session:
+            row = session.get(ConversationState, session_id)
+            if row is None or self._is_expired(row.updated_at):
+                return None
+            self.loads += 1
+            summarized = row.summarized_messages or 0
+            return {
+                'history': deserialize_history(row.history, summarized),
+                'summary': row.summary or '',
+                'summarized_messages': summarized,
+                'turn_count': row.turn_count,
+                'context': row.context or {},
+                'created_at': row.created_at,
+                'updated_at': row.updated_at
+            }
+
+    def _try_append(self, session, session_id, pairs, initial_context, context_update) -> Optional[int]:
+        now = datetime.utcnow()
+        row = session.get(ConversationState, session_id)
+        if row is None or self._is_expired(row.updated_at):
+            if row is not None:
+                session.delete(row)
+                session.flush()
+            context = dict(initial_context or {})
+            context.update(context_update or {})
+            session.add(ConversationState(
+                session_id=session_id,
+                history=serialize_history(pairs),
+                turn_count=1,
+                context=context,
+                created_at=now,
+                updated_at=now
+            ))
+            return 1
+
+        context = dict(row.context or {})
+        context.update(context_update or {})
+        updated = session.query(ConversationState).filter_by(
+            session_id=session_id, turn_count=row.turn_count
+        ).update({
+            'history': serialize_history(json.loads(row.history or '[]') + pairs),
+            'turn_count': row.turn_count + 1,
+            'context': context,
+            'updated_at': now
+        }, synchronize_session=False)
+        return row.turn_count + 1 if updated else None
+
+    def append_turn(self, session_id, messages, initial_context=None, context_update=None) -> int:
+        pairs = encode_messages(messages)
+        for _ in range(self.max_retries):
+            try:
+                with metrics.timer("db_write_seconds", operation="session_append"), self.session_scope() as session:
+                    revision = self._try_append(session, session_id, pairs, initial_context, context_update)
+            except IntegrityError:
+                # Another worker created the session first
+                revision = None
+            if revision is not None:
+                self.saves += 1
+                return revision
+            self.conflicts += 1
+        raise RuntimeError(f"Could not save turn for session {session_id}: too many concurrent writers")
+
+    def save_summary(self, session_id: str, summary: str, summarized_messages: int) -> None:
+        with metrics.timer("db_write_seconds", operation="session_summary"), self.session_scope() as session:
+            session.query(ConversationState).filter(
+                ConversationState.session_id == session_id,
+                ConversationState.summarized_messages < summarized_messages
+            ).update({'summary': summary, 'summarized_messages': summarized_messages}, synchronize_session=False)
+
+    def delete(self, session_id: str) -> None:
+        with self.session_scope() as session:
+            session.query(ConversationState).filter_by(session_id=session_id).delete()
+
+    def purge_expired(self) -> int:
+        cutoff = self._expired_before()
+        if cutoff is None:
+            return 0
+        with metrics.timer("db_write_seconds", operation="session_purge"), self.session_scope() as session:
+            return session.query(ConversationState).filter(ConversationState.updated_at < cutoff).delete()
+
+    def count(self) -> int:
+        with self.session_scope() as session:
+            return session.query(ConversationState).count()
+
+
+class MemoryConversationStore(ConversationStore):
+    """Process-local conversation store for single-worker development runs"""
+
+    backend = 'memory'
+
+    def __init__(self, ttl_seconds: Optional[float] = 1800):
+        super().__init__(ttl_seconds)
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+
+    def _live(self, session_id: str) -> Optional[Dict[str, Any]]:
+        state = self._sessions.get(session_id)
+        if state is None or self._is_expired(state['updated_at']):
+            return None
+        return state
+
+    def revision(self, session_id: str) -> Optional[int]:
+        with self._lock:
+            state = self._live(session_id)
+            return state['turn_count'] if state else None
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            state = self._live(session_id)
+            if state is None:
+                return None
+            self.loads += 1
+            return {
+                **state,
+                'history': deserialize_history(state['history'], state['summarized_messages']),
+                'context': dict(state['context'])
+            }
+
+    def append_turn(self, session_id, messages, initial_context=None, context_update=None) -> int:
+        pairs = encode_messages(messages)
+        now = datetime.utcnow()
+        with self._lock:
+            state = self._live(session_id)
+            if state is None:
+                state = {
+                    'history': '[]',
+                    'turn_count': 0,
+                    'context': dict(initial_context or {}),
+                    'summary': '',
+                    'summarized_messages': 0,
+                    'created_at': now
+                }
+                self._sessions[session_id] = state
+            state['history'] = serialize_history(json.loads(state['history']) + pairs)
+            state['turn_count'] += 1
+            state['context'].update(context_update or {})
+            state['updated_at'] = now
+            self.saves += 1
+            return state['turn_count']
+
+    def save_summary(self, session_id: str, summary: str, summarized_messages: int) -> None:
+        with self._lock:
+            state = self._live(session_id)
+            if state is not None and state['summarized_messages'] < summarized_messages:
+                state['summary'] = summary
+                state['summarized_messages'] = summarized_messages
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            expired = [key for key, state in self._sessions.items() if self._is_expired(state['updated_at'])]
+            for key in expired:
+                del self._sessions[key]
+            return len(expired)
+
+    def count(self) -> int:
+        return len(self._sessions)
+
+
+CONVERSATION_STORE_BACKENDS = {
+    'sql': SQLConversationStore,
+    'memory': MemoryConversationStore
+}
+
+
+def create_conversation_store(backend: str = 'sql', ttl_seconds: Optional[float] = 1800) -> ConversationStore:
+    """Build a conversation store by backend name ('sql' or 'memory')"""
+    try:
+        store_class = CONVERSATION_STORE_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown conversation store backend '{backend}', expected one of {sorted(CONVERSATION_STORE_BACKENDS)}")
+    return store_class(ttl_seconds=ttl_seconds)
@@ -1,5 +1,5 @@
 import pandas as pd
-from sqlalchemy import create_engine, Column, String, Text, ForeignKey, MetaData, Table, DateTime, Float, JSON, Index
+from sqlalchemy import create_engine, event, inspect, text, Column, String, Text, ForeignKey, MetaData, Table, DateTime, Float, Integer, JSON, Index
 from datetime import datetime
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
@@ -80,6 +80,74 @@ class Feedback(Base):
     problem = relationship("Problem", back_populates="feedbacks")
     suggestion = relationship("Suggestion", back_populates="feedbacks")
 
+# Feedback still waiting for its authoritative LLM sentiment score
+# (see src/sentiment_scoring.py); until then feedback_sentiment holds a local estimate
+class FeedbackScoringJob(Base):
+    __tablename__ = 'feedback_scoring_jobs'
+
+    feedback_id = Column(String(50), ForeignKey('feedback.id'), primary_key=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+# Rollups of the feedback table, maintained incrementally as feedback is
+# stored (see src/feedback_rollups.py) so reports never scan raw feedback.
+class FeedbackProblemRollup(Base):
+    __tablename__ = 'feedback_problem_rollups'
+
+    problem_id = Column(String(10), primary_key=True)
+    usage_count = Column(Integer, nullable=False, default=0)
+
+class FeedbackSuggestionRollup(Base):
+    __tablename__ = 'feedback_suggestion_rollups'
+
+    suggestion_id = Column(String(10), primary_key=True)
+    total_uses = Column(Integer, nullable=False, default=0)
+    sentiment_sum = Column(Float, nullable=False, default=0.0)
+    sentiment_count = Column(Integer, nullable=False, default=0)
+
+class FeedbackSentimentRollup(Base):
+    __tablename__ = 'feedback_sentiment_rollups'
+
+    # Sentiment rounded to one decimal; feedback without a score counts as 0.0
+    bucket = Column(Float, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class FeedbackHourlyRollup(Base):
+    __tablename__ = 'feedback_hourly_rollups'
+
+    hour = Column(DateTime, primary_key=True)
+    feedback_count = Column(Integer, nullable=False, default=0)
+    sentiment_sum = Column(Float, nullable=False, default=0.0)
+    sentiment_count = Column(Integer, nullable=False, default=0)
+
+# Conversation state shared by all API workers (see src/conversation_store.py)
+class ConversationState(Base):
+    __tablename__ = 'conversation_states'
+
+    session_id = Column(String(50), primary_key=True)
+    # Compact JSON list of [role, content] pairs
+    history = Column(Text, nullable=False, default='[]')
+    turn_count = Column(Integer, nullable=False, default=0)
+    context = Column(JSON)
+    # Rolling summary of the first summarized_messages history messages
+    summary = Column(Text, nullable=True)
+    summarized_messages = Column(Integer, nullable=False, default=0, server_default='0')
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+# Persistent cache of answers to history-free questions (see src/response_cache.py)
+class ResponseCacheEntry(Base):
+    __tablename__ = 'response_cache'
+
+    # sha256 of model name, KB version and normalized message
+    cache_key = Column(String(64), primary_key=True)
+    model_name = Column(String(100), nullable=False)
+    kb_version = Column(String(32), nullable=False)
+    response = Column(Text, nullable=False)
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    last_used_at = Column(DateTime, default=datetime.utcnow, index=True)
+
 class FinetuningExample(Base):
     __tablename__ = 'finetuning_examples'
 
@@ -191,6 +259,43 @@ def load_dataframes_to_db(engine, dataframes):
     finally:
         session.close()
 
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers proceed while another process writes; busy_timeout
+    # makes concurrent writers wait instead of failing with "database is locked"
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+def configure_sqlite(engine):
+    """Make a SQLite engine safe to share between several worker processes"""
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+    return engine
+
+# Columns added to existing tables after their first release; create_all
+# only creates missing tables, so these are added in place
+ADDED_COLUMNS = {
+    'conversation_states': ['summary', 'summarized_messages']
+}
+
+def add_missing_columns(engine):
+    """Add columns introduced after a table was created to an existing database"""
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table_name, column_names in ADDED_COLUMNS.items():
+            if not inspector.has_table(table_name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table_name)}
+            for name in column_names:
+                if name in existing:
+                    continue
+                column = Base.metadata.tables[table_name].columns[name]
+                column_type = column.type.compile(dialect=engine.dialect)
+                default = f" DEFAULT {column.server_default.arg}" if column.server_default is not None else ""
+                not_null = " NOT NULL" if not column.nullable and default else ""
+                connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {name} {column_type}{not_null}{default}"))
+
 # Database session management
 engine = None
 SessionFactory = None
@@ -205,8 +310,10 @@ def init_db(connection_string):
         pool_recycle=3600,
         pool_pre_ping=True
     )
+    configure_sqlite(engine)
     SessionFactory = sessionmaker(bind=engine)
     Base.metadata.create_all(bind=engine)
+    add_missing_columns(engine)
 
 @contextmanager
 def get_db_session():
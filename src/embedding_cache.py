@@ -0,0 +1,271 @@
+import os
+import re
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    import fcntl
+except ImportError:
+    # No POSIX file locks (Windows): the cache stays in memory only
+    fcntl = None
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+# Shared by the API and the vector DB build scripts
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'embedding_cache')
+
+# On-disk file layout: a header of magic + dimension, then fixed-size records
+# of a 16-byte key digest followed by the vector as packed little-endian float32
+MAGIC = b"EMBC"
+HEADER = struct.Struct("<4sI")
+KEY_SIZE = 16
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace, which never changes the embedding of a sentence"""
+    return " ".join(text.split())
+
+
+def embedding_key(model_name: str, text: str) -> bytes:
+    return hashlib.blake2b(f"{model_name}\x00{text}".encode('utf-8'), digest_size=KEY_SIZE).digest()
+
+
+class DiskEmbeddingStore:
+    """Append-only file of float32 embeddings for one model, shared between processes.
+
+    Only an index of key -> file offset is held in memory; vectors are read
+    back on demand. Appends take an exclusive ``flock`` on the file and
+    compute their offset from its end under that lock, so several workers
+    can share one file; records appended by other processes are picked up
+    on a miss when the file has grown. Once ``max_entries`` records are
+    stored, new embeddings are no longer written.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._index: Dict[bytes, int] = {}
+        self._dimension: Optional[int] = None
+        self._loaded_size = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            self._load_locked()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _record_size(self, dimension: int) -> int:
+        return KEY_SIZE + 4 * dimension
+
+    @staticmethod
+    def _read_dimension(f) -> Optional[int]:
+        f.seek(0)
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return None
+        magic, dimension = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError(f"{f.name} is not an embedding cache file")
+        return dimension
+
+    def _load_locked(self) -> None:
+        """Index records added to the file since the last load"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                if self._dimension is None:
+                    self._dimension = self._read_dimension(f)
+                    if self._dimension is None:
+                        return
+                    self._loaded_size = HEADER.size
+                f.seek(self._loaded_size)
+                data = f.read()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        record_size = self._record_size(self._dimension)
+        # A torn record at the end is skipped here and cut off by the next append
+        complete = len(data) - len(data) % record_size
+        for start in range(0, complete, record_size):
+            self._index[data[start:start + KEY_SIZE]] = self._loaded_size + start + KEY_SIZE
+        self._loaded_size += complete
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        with self._lock:
+            offset = self._index.get(key)
+            if offset is None:
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self._loaded_size:
+                    self._load_locked()
+                    offset = self._index.get(key)
+                if offset is None:
+                    return None
+            dimension = self._dimension
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return np.frombuffer(f.read(4 * dimension), dtype='<f4')
+
+    def put(self, key: bytes, vector: np.ndarray) -> None:
+        with self._lock:
+            if key in self._index or len(self._index) >= self.max_entries:
+                return
+            with open(self.path, 'a+b') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    end = f.seek(0, os.SEEK_END)
+                    if end == 0:
+                        f.write(HEADER.pack(MAGIC, len(vector)))
+                        end = HEADER.size
+                    dimension = self._read_dimension(f)
+                    if len(vector) != dimension:
+                        return
+                    record_size = self._record_size(dimension)
+                    torn = (end - HEADER.size) % record_size
+                    if torn:
+                        # A write cut short by a crash; drop it so records stay aligned
+                        end -= torn
+                        f.truncate(end)
+                    f.write(key + np.asarray(vector, dtype='<f4').tobytes())
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+            if self._dimension is None:
+                self._dimension = dimension
+                self._loaded_size = HEADER.size
+            self._index[key] = end + KEY_SIZE
+            if end == self._loaded_size:
+                self._loaded_size = end + record_size
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that skips the encoder for text it has seen before.
+
+    Vectors are keyed by model name and whitespace-normalized text. Lookups
+    go to an in-memory LRU of ``max_memory_entries`` vectors, then to the
+    on-disk store under ``cache_dir`` (if set, and on platforms with POSIX
+    file locks), which survives restarts and is shared by every process
+    using the same directory. Only the misses of a batch are sent to the
+    underlying model, in one call.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        model_name: str,
+        cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+        max_memory_entries: int = 10000,
+        max_disk_entries: int = 100000
+    ):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.max_memory_entries = max_memory_entries
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self.disk: Optional[DiskEmbeddingStore] = None
+        if cache_dir and max_disk_entries > 0 and fcntl is not None:
+            file_name = re.sub(r'[^A-Za-z0-9._-]+', '_', model_name) + '.f32'
+            self.disk = DiskEmbeddingStore(os.path.join(cache_dir, file_name), max_entries=max_disk_entries)
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _remember(self, key: bytes, vector: np.ndarray) -> None:
+        if self.max_memory_entries <= 0:
+            return
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, key: bytes) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+        if self.disk is not None:
+            vector = self.disk.get(key)
+            if vector is not None:
+                self.disk_hits += 1
+                self._remember(key, vector)
+                return vector
+        return None
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        normalized = [normalize_text(text) for text in texts]
+        keys = [embedding_key(self.model_name, text) for text in normalized]
+        vectors: List[Optional[np.ndarray]] = [self._lookup(key) for key in keys]
+
+        # Duplicates within the batch are encoded once
+        missing: Dict[bytes, str] = {}
+        for key, text, vector in zip(keys, normalized, vectors):
+            if vector is None:
+                missing.setdefault(key, text)
+        if missing:
+            self.misses += len(missing)
+            computed = self.underlying.embed_documents(list(missing.values()))
+            fresh = {}
+            for key, embedding in zip(missing, computed):
+                vector = np.asarray(embedding, dtype=np.float32)
+                fresh[key] = vector
+                self._remember(key, vector)
+                if self.disk is not None:
+                    self.disk.put(key, vector)
+            vectors = [fresh[key] if vector is None else vector for key, vector in zip(keys, vectors)]
+        return [vector.tolist() for vector in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        text = normalize_text(text)
+        key = embedding_key(self.model_name, text)
+        vector = self._lookup(key)
+        if vector is None:
+            self.misses += 1
+            vector = np.asarray(self.underlying.embed_query(text), dtype=np.float32)
+            self._remember(key, vector)
+            if self.disk is not None:
+                self.disk.put(key, vector)
+        return vector.tolist()
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'model_name': self.model_name,
+            'memory_entries': len(self._memory),
+            'max_memory_entries': self.max_memory_entries,
+            'disk_entries': len(self.disk) if self.disk is not None else 0,
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+        }
+
+
+def cached_huggingface_embeddings(
+    model_name: str = DEFAULT_EMBEDDING_MODEL,
+    cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+    max_memory_entries: int = 10000,
+    max_disk_entries: int = 100000,
+    device: str = 'cpu'
+) -> CachedEmbeddings:
+    """Sentence-transformers embeddings behind the shared two-tier cache"""
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    underlying = HuggingFaceEmbeddings(model_name=model_name, model_kwargs={'device': device})
+    return CachedEmbeddings(
+        underlying,
+        model_name,
+        cache_dir=cache_dir,
+        max_memory_entries=max_memory_entries,
+        max_disk_entries=max_disk_entries
+    )
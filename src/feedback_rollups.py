@@ -0,0 +1,184 @@
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.db_schema import (
+    Problem, Suggestion, Feedback,
+    FeedbackProblemRollup, FeedbackSuggestionRollup,
+    FeedbackSentimentRollup, FeedbackHourlyRollup
+)
+
+ROLLUP_MODELS = [FeedbackProblemRollup, FeedbackSuggestionRollup, FeedbackSentimentRollup, FeedbackHourlyRollup]
+
+
+def sentiment_bucket(sentiment: Optional[float]) -> float:
+    """Round a sentiment score to its report bucket (one decimal place)"""
+    return round(float(sentiment or 0.0), 1)
+
+
+def hour_of(timestamp: Optional[datetime]) -> datetime:
+    """Truncate a timestamp to the start of its hour"""
+    return (timestamp or datetime.utcnow()).replace(minute=0, second=0, microsecond=0)
+
+
+def _increment(session, model, key: Dict[str, Any], increments: Dict[str, Any]) -> None:
+    """Atomically add increments to a rollup row, creating it if needed"""
+    table = model.__table__
+    stmt = sqlite_insert(table).values(**key, **increments)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(key),
+        set_={column: table.c[column] + stmt.excluded[column] for column in increments}
+    )
+    session.execute(stmt)
+
+
+def record_feedback(session, feedback: Feedback) -> None:
+    """Add one feedback row to every rollup, in the caller's transaction"""
+    sentiment = feedback.feedback_sentiment
+    has_sentiment = sentiment is not None
+
+    if feedback.problem_id:
+        _increment(session, FeedbackProblemRollup, {'problem_id': feedback.problem_id}, {'usage_count': 1})
+    if feedback.suggestion_id:
+        _increment(session, FeedbackSuggestionRollup, {'suggestion_id': feedback.suggestion_id}, {
+            'total_uses': 1,
+            'sentiment_sum': sentiment if has_sentiment else 0.0,
+            'sentiment_count': 1 if has_sentiment else 0
+        })
+    _increment(session, FeedbackSentimentRollup, {'bucket': sentiment_bucket(sentiment)}, {'count': 1})
+    _increment(session, FeedbackHourlyRollup, {'hour': hour_of(feedback.created_at)}, {
+        'feedback_count': 1,
+        'sentiment_sum': sentiment if has_sentiment else 0.0,
+        'sentiment_count': 1 if has_sentiment else 0
+    })
+
+
+def update_feedback_sentiment(session, feedback: Feedback, sentiment: Optional[float]) -> None:
+    """Change a stored feedback's sentiment and move its contribution in every rollup"""
+    old = feedback.feedback_sentiment
+    feedback.feedback_sentiment = sentiment
+    sum_delta = (sentiment or 0.0) - (old or 0.0)
+    count_delta = int(sentiment is not None) - int(old is not None)
+
+    if feedback.suggestion_id:
+        _increment(session, FeedbackSuggestionRollup, {'suggestion_id': feedback.suggestion_id}, {
+            'total_uses': 0,
+            'sentiment_sum': sum_delta,
+            'sentiment_count': count_delta
+        })
+    if sentiment_bucket(old) != sentiment_bucket(sentiment):
+        _increment(session, FeedbackSentimentRollup, {'bucket': sentiment_bucket(old)}, {'count': -1})
+        _increment(session, FeedbackSentimentRollup, {'bucket': sentiment_bucket(sentiment)}, {'count': 1})
+    _increment(session, FeedbackHourlyRollup, {'hour': hour_of(feedback.created_at)}, {
+        'feedback_count': 0,
+        'sentiment_sum': sum_delta,
+        'sentiment_count': count_delta
+    })
+
+
+def rebuild_rollups(session) -> int:
+    """Recompute every rollup from the raw feedback table and return the rows scanned"""
+    for model in ROLLUP_MODELS:
+        session.query(model).delete()
+
+    problems: Dict[str, int] = {}
+    suggestions: Dict[str, Tuple[int, float, int]] = {}
+    buckets: Dict[float, int] = {}
+    hours: Dict[datetime, Tuple[int, float, int]] = {}
+
+    scanned = 0
+    rows = session.query(
+        Feedback.problem_id, Feedback.suggestion_id, Feedback.feedback_sentiment, Feedback.created_at
+    ).yield_per(1000)
+    for problem_id, suggestion_id, sentiment, created_at in rows:
+        scanned += 1
+        has_sentiment = int(sentiment is not None)
+        if problem_id:
+            problems[problem_id] = problems.get(problem_id, 0) + 1
+        if suggestion_id:
+            uses, total, count = suggestions.get(suggestion_id, (0, 0.0, 0))
+            suggestions[suggestion_id] = (uses + 1, total + (sentiment or 0.0), count + has_sentiment)
+        bucket = sentiment_bucket(sentiment)
+        buckets[bucket] = buckets.get(bucket, 0) + 1
+        hour = hour_of(created_at)
+        feedback_count, total, count = hours.get(hour, (0, 0.0, 0))
+        hours[hour] = (feedback_count + 1, total + (sentiment or 0.0), count + has_sentiment)
+
+    session.add_all([FeedbackProblemRollup(problem_id=k, usage_count=v) for k, v in problems.items()])
+    session.add_all([
+        FeedbackSuggestionRollup(suggestion_id=k, total_uses=uses, sentiment_sum=total, sentiment_count=count)
+        for k, (uses, total, count) in suggestions.items()
+    ])
+    session.add_all([FeedbackSentimentRollup(bucket=k, count=v) for k, v in buckets.items()])
+    session.add_all([
+        FeedbackHourlyRollup(hour=k, feedback_count=feedback_count, sentiment_sum=total, sentiment_count=count)
+        for k, (feedback_count, total, count) in hours.items()
+    ])
+    return scanned
+
+
+def get_usage_report(session, hours: int = 48) -> Dict[str, Any]:
+    """Build the KB usage report from the rollup tables only"""
+    problem_usage = session.query(
+        Problem.problem_id,
+        Problem.problem_name,
+        func.coalesce(FeedbackProblemRollup.usage_count, 0)
+    ).outerjoin(
+        FeedbackProblemRollup,
+        Problem.problem_id == FeedbackProblemRollup.problem_id
+    ).all()
+
+    suggestion_effectiveness = session.query(
+        Suggestion.suggestion_id,
+        Suggestion.suggestion_text,
+        FeedbackSuggestionRollup.sentiment_sum,
+        FeedbackSuggestionRollup.sentiment_count,
+        func.coalesce(FeedbackSuggestionRollup.total_uses, 0)
+    ).outerjoin(
+        FeedbackSuggestionRollup,
+        Suggestion.suggestion_id == FeedbackSuggestionRollup.suggestion_id
+    ).all()
+
+    # Buckets emptied by rescoring stay behind with a zero count
+    sentiment_rows = session.query(
+        FeedbackSentimentRollup.bucket, FeedbackSentimentRollup.count
+    ).filter(FeedbackSentimentRollup.count > 0).order_by(FeedbackSentimentRollup.bucket).all()
+    total_feedback = sum(count for _, count in sentiment_rows) or 1
+
+    hourly_rows = session.query(FeedbackHourlyRollup).order_by(FeedbackHourlyRollup.hour.desc()).limit(hours).all()
+
+    return {
+        "problem_usage": [
+            {
+                "problem_id": str(p_id),
+                "problem_name": p_name,
+                "usage_count": int(p_count)
+            }
+            for p_id, p_name, p_count in problem_usage
+        ],
+        "suggestion_effectiveness": [
+            {
+                "suggestion_id": str(s_id) if s_id is not None else None,
+                "suggestion_text": s_text if s_text is not None else "",
+                "average_rating": float(s_sum) / s_count if s_count else 0.0,
+                "total_uses": int(s_uses)
+            }
+            for s_id, s_text, s_sum, s_count, s_uses in suggestion_effectiveness
+        ],
+        "feedback_sentiment": [
+            {
+                "sentiment": float(bucket),
+                "count": int(count),
+                "percentage": float(count) / total_feedback
+            }
+            for bucket, count in sentiment_rows
+        ],
+        "feedback_by_hour": [
+            {
+                "hour": row.hour.isoformat(),
+                "count": row.feedback_count,
+                "average_sentiment": row.sentiment_sum / row.sentiment_count if row.sentiment_count else 0.0
+            }
+            for row in hourly_rows
+        ]
+    }
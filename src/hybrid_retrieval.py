@@ -0,0 +1,78 @@
+import re
+import math
+import heapq
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+from langchain_core.documents import Document
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'for', 'from', 'how', 'i', 'in',
+    'is', 'it', 'me', 'my', 'of', 'on', 'or', 'so', 'that', 'the', 'to', 'what', 'with', 'you', 'your'
+}
+# Rank constant from the original reciprocal rank fusion paper
+RRF_K = 60
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+class BM25Index:
+    """In-memory inverted index scoring documents with Okapi BM25.
+
+    Exact terms such as "PTSD" or "burnout" that a dense embedding may not
+    rank highly score strongly here. The index is immutable; build a new one
+    when the document set changes.
+    """
+
+    def __init__(self, documents: Sequence[Document], k1: float = 1.5, b: float = 0.75):
+        self.documents = list(documents)
+        self.k1 = k1
+        self.b = b
+        # term -> [(document index, term frequency)]
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._lengths: List[int] = []
+        for index, document in enumerate(self.documents):
+            counts = Counter(tokenize(document.page_content))
+            self._lengths.append(sum(counts.values()))
+            for term, frequency in counts.items():
+                self._postings.setdefault(term, []).append((index, frequency))
+        self._average_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+        total = len(self.documents)
+        self._idf = {
+            term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def search(self, query: str, k: int) -> List[Tuple[Document, float]]:
+        """Return up to k (document, BM25 score) pairs, best first"""
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for index, frequency in self._postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[index] / self._average_length)
+                scores[index] = scores.get(index, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.documents[index], score) for index, score in best]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Fuse ranked ID lists: each ID scores the sum of 1 / (k + rank) over the lists it appears in.
+
+    An ID repeated within one list only counts at its best rank.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        seen = set()
+        for rank, key in enumerate(ranking, 1):
+            if key in seen:
+                continue
+            seen.add(key)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
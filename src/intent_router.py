@@ -0,0 +1,228 @@
+import re
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from src.kb_cache import kb_cache
+from src.db_schema import Problem, SelfAssessment, Suggestion
+
+TOKEN_PATTERN = re.compile(r"[a-z']+")
+
+# Words in problem names that say nothing about which problem is meant
+GENERIC_NAME_WORDS = {'issues', 'issue', 'disorder', 'management', 'concerns', 'use', 'low', 'self'}
+# Words a request topic may contain besides problem terms ("my sleep issues")
+TOPIC_FILLER_WORDS = {
+    'a', 'an', 'the', 'my', 'me', 'i', 'i\'m', 'im', 'of', 'with', 'for', 'about', 'on', 'and', 'or',
+    'some', 'any', 'this', 'that', 'please', 'really', 'so', 'much', 'very', 'bad', 'lately', 'now', 'feeling'
+}
+# Everyday words for problems, keyed by the lower-cased problem name
+PROBLEM_SYNONYMS = {
+    'anxiety': {'anxious', 'worry', 'worrying', 'nervous'},
+    'depression': {'depressed'},
+    'stress': {'stressed', 'stressful', 'overwhelmed'},
+    'sleep issues': {'insomnia', 'asleep', 'sleeping'},
+    'social isolation': {'lonely', 'loneliness', 'isolated'},
+    'panic disorder': {'panicking'},
+    'ptsd': {'trauma', 'traumatic', 'flashbacks'},
+    'ocd': {'obsessive', 'compulsive', 'compulsions'},
+    'burnout': {'exhausted', 'burned', 'burnt'},
+    'grief': {'grieving', 'bereavement', 'mourning'},
+    'low self-esteem': {'confidence'},
+    'anger management': {'angry', 'rage', 'temper'},
+    'relationship issues': {'relationships', 'partner', 'breakup'},
+    'eating concerns': {'eating', 'food', 'body'},
+    'substance use': {'alcohol', 'drinking', 'drugs', 'addiction'}
+}
+
+LIST_PROBLEMS_PATTERN = re.compile(
+    r"\b(list (all |the )?(problems|topics|issues)"
+    r"|what (problems|topics|issues|conditions|things) (do|can) you (cover|help|handle|support|talk)"
+    r"|which (problems|topics|issues|conditions)"
+    r"|what can you help( me)? with)\b"
+)
+# Requests name their topic right after the request ("tips for <topic>") or,
+# for a noun, in the two words before it ("<topic> tips"), tried in that
+# order. The topic must consist of problem terms and filler words only, so
+# "what can I do about my partner hitting me" never gets the template.
+SUGGESTIONS_PATTERNS = (
+    re.compile(
+        r"\b(what (can|should) i do (about|for|with)"
+        r"|how (can|do|should) i (deal with|cope with|manage|handle|improve|reduce|overcome|get over|stop)"
+        r"|(tips|suggestions?|advice|strateg(y|ies)|ideas|ways) (for|on|about|with|to (deal with|cope with|manage|handle|improve|reduce|overcome|stop))"
+        r"|(help|coping) (with|for)) (?P<topic>.+)"
+    ),
+    re.compile(r"\b(?P<topic>[a-z'-]+( [a-z'-]+)?) (tips|suggestions|advice|strategies|techniques)\b")
+)
+ASSESSMENT_PATTERNS = (
+    re.compile(
+        r"\b((self[- ]?assessment|assessment|quiz|screening|questionnaire|test) (for|on|about)"
+        r"|do i have|how do i know if i have|test myself for) (?P<topic>.+)"
+    ),
+    re.compile(r"\b(?P<topic>[a-z'-]+( [a-z'-]+)?) (self[- ]?assessment|assessment|quiz|screening|questionnaire|test)\b")
+)
+# A negation anywhere ("I don't want advice", "tips for anxiety that don't
+# work") means the message is not a plain request
+NEGATION_PATTERN = re.compile(r"\b(no|not|never|nothing|without|don'?t|doesn'?t|didn'?t|won'?t|can'?t|cannot)\b")
+# Messages touching on any of these always go to the LLM, never to a template
+CRISIS_PATTERN = re.compile(
+    r"\b(suicid\w*|kill (myself|me)|end (my|it all)|self[- ]?harm\w*|hurt(ing)? myself|want to die|overdose)\b"
+)
+# Expressions of despair also go to the LLM: they call for a personal
+# answer, not a list, even when the message asks for tips
+DISTRESS_PATTERN = re.compile(
+    r"\b(hopeless\w*|worthless\w*|helpless\w*|empty inside|numb|pointless|no point|nothing matters"
+    r"|can'?t (go on|take (it|this) anymore)|giv(e|ing) up|hate myself|a burden|better off without me)\b"
+)
+# Abuse, violence and physical danger need a personal answer too, even when
+# the topic looks like a problem ("my anger at my abusive dad")
+HARM_PATTERN = re.compile(
+    r"\b(hit(s|ting)?|beat(s|ing)? me|hurt(s|ing)? me|abus\w*|assault\w*|rap(e|ed|ing)|violen\w*|threat\w*"
+    r"|kill(s|ing)? me|weapon|gun|knife|cut(ting)? myself|burn(ing)? myself|starv(e|ing) myself|unsafe)\b"
+)
+def needs_personal_answer(message: str) -> bool:
+    """Whether a message touches on a crisis, despair or harm, or contains a negation.
+
+    Such messages must not be answered with a template or with the cached
+    answer to a similar question: "I want to die" and "I don't want to die"
+    embed close together.
+    """
+    text = " ".join(message.lower().split())
+    return any(pattern.search(text) for pattern in (CRISIS_PATTERN, DISTRESS_PATTERN, HARM_PATTERN, NEGATION_PATTERN))
+
+# Longer messages tell a story and deserve an open-ended answer
+MAX_ROUTED_WORDS = 20
+
+
+class IntentRouter:
+    """Answer structured questions about the knowledge base without the LLM.
+
+    Recognizes requests for the list of problems, for suggestions about a
+    problem and for a problem's self-assessment questions, and answers them
+    with templated text built from the DB. Anything else, anything mentioning
+    more than one problem, anything with a negation ("I don't want advice")
+    and anything touching on a crisis, despair or harm returns None so the
+    message goes through the RAG chain. A request is only routed when its
+    topic is nothing but a problem ("tips for my sleep issues"). Problems, suggestions and
+    questions are read through the shared KB snapshot, so routing costs a
+    few dictionary lookups once the snapshot is warm.
+    """
+
+    def __init__(self, session_factory: Callable):
+        self.session_factory = session_factory
+
+    def _load_problems(self) -> List[Dict[str, Any]]:
+        session = self.session_factory()
+        try:
+            problems = session.query(Problem).order_by(Problem.problem_id).all()
+            return [{
+                'id': p.problem_id,
+                'name': p.problem_name,
+                'description': p.description or '',
+                'terms': self._problem_terms(p.problem_name)
+            } for p in problems]
+        finally:
+            session.close()
+
+    @staticmethod
+    def _problem_terms(name: str) -> Set[str]:
+        terms = {word for word in TOKEN_PATTERN.findall(name.lower().replace('-', ' ')) if word not in GENERIC_NAME_WORDS}
+        # Short names like PTSD are matched as-is
+        return terms | PROBLEM_SYNONYMS.get(name.lower(), set())
+
+    def _load_suggestions(self, problem_id: str) -> List[Dict[str, Any]]:
+        session = self.session_factory()
+        try:
+            suggestions = session.query(Suggestion).filter_by(problem_id=problem_id).order_by(Suggestion.suggestion_id).all()
+            return [{'id': s.suggestion_id, 'text': s.suggestion_text, 'resource': s.resource_link} for s in suggestions]
+        finally:
+            session.close()
+
+    def _load_questions(self, problem_id: str) -> List[Dict[str, Any]]:
+        session = self.session_factory()
+        try:
+            questions = session.query(SelfAssessment).filter_by(problem_id=problem_id).order_by(SelfAssessment.question_id).all()
+            return [{'id': q.question_id, 'text': q.question_text, 'type': q.response_type} for q in questions]
+        finally:
+            session.close()
+
+    @staticmethod
+    def _matches(word: str, term: str) -> bool:
+        # "sleep" matches "sleep" and "sleepless"; short terms like "ocd" only match exactly
+        return word == term or (len(term) >= 5 and word.startswith(term))
+
+    def _is_problem_topic(self, words: List[str], problems: List[Dict[str, Any]]) -> bool:
+        """Whether every word of a topic names a problem or is filler"""
+        return all(
+            word in TOPIC_FILLER_WORDS or word in GENERIC_NAME_WORDS
+            or any(self._matches(word, term) for p in problems for term in p['terms'])
+            for word in words
+        )
+
+    def _match_problems(self, words: List[str], problems: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [p for p in problems if any(self._matches(word, term) for word in words for term in p['terms'])]
+
+    @staticmethod
+    def _find_request(patterns: Tuple[re.Pattern, ...], text: str) -> Optional[str]:
+        """Return the topic of the first request form found in text, or None"""
+        for pattern in patterns:
+            match = pattern.search(text)
+            if match is not None:
+                return match.group('topic')
+        return None
+
+    def route(self, message: str) -> Optional[Dict[str, Any]]:
+        """Return {'intent', 'text', 'suggestions'} for a structured question, or None"""
+        text = " ".join(message.lower().split())
+        words = TOKEN_PATTERN.findall(text)
+        if not words or len(words) > MAX_ROUTED_WORDS or any(
+            pattern.search(text) for pattern in (CRISIS_PATTERN, DISTRESS_PATTERN, HARM_PATTERN)
+        ):
+            return None
+
+        problems, _ = kb_cache.get("intent_router:problems", self._load_problems)
+        if LIST_PROBLEMS_PATTERN.search(text):
+            return self._answer_problem_list(problems)
+
+        suggestions_request = self._find_request(SUGGESTIONS_PATTERNS, text)
+        assessment_request = self._find_request(ASSESSMENT_PATTERNS, text)
+        if (suggestions_request is None) == (assessment_request is None):
+            return None
+        wants_suggestions = suggestions_request is not None
+        if NEGATION_PATTERN.search(text):
+            return None
+        topic_words = TOKEN_PATTERN.findall(suggestions_request or assessment_request)
+        if not self._is_problem_topic(topic_words, problems):
+            return None
+        matched = self._match_problems(topic_words, problems)
+        if len(matched) != 1:
+            return None
+        problem = matched[0]
+
+        if wants_suggestions:
+            suggestions, _ = kb_cache.get(f"intent_router:suggestions:{problem['id']}", lambda: self._load_suggestions(problem['id']))
+            return self._answer_suggestions(problem, suggestions) if suggestions else None
+        questions, _ = kb_cache.get(f"intent_router:questions:{problem['id']}", lambda: self._load_questions(problem['id']))
+        return self._answer_assessment(problem, questions) if questions else None
+
+    @staticmethod
+    def _answer_problem_list(problems: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if not problems:
+            return None
+        lines = [f"- {p['name']}: {p['description']}" if p['description'] else f"- {p['name']}" for p in problems]
+        text = "I can help with these topics:\n" + "\n".join(lines) + "\n\nTell me which one you'd like to talk about."
+        return {'intent': 'list_problems', 'text': text, 'suggestions': []}
+
+    @staticmethod
+    def _answer_suggestions(problem: Dict[str, Any], suggestions: List[Dict[str, Any]]) -> Dict[str, Any]:
+        lines = [f"- {s['text']}" + (f" (Resource: {s['resource']})" if s['resource'] else "") for s in suggestions]
+        text = (
+            f"Here are some things that can help with {problem['name'].lower()}:\n" + "\n".join(lines)
+            + "\n\nWould you like to talk about how you're feeling, or try one of these together?"
+        )
+        return {'intent': 'suggestions', 'text': text, 'suggestions': suggestions, 'problem_id': problem['id']}
+
+    @staticmethod
+    def _answer_assessment(problem: Dict[str, Any], questions: List[Dict[str, Any]]) -> Dict[str, Any]:
+        lines = [f"{number}. {q['text']}" for number, q in enumerate(questions, 1)]
+        text = (
+            f"Here are a few questions to reflect on about {problem['name'].lower()}:\n" + "\n".join(lines)
+            + "\n\nThis isn't a diagnosis, but you can share your answers here and I'll suggest next steps."
+        )
+        return {'intent': 'self_assessment', 'text': text, 'suggestions': [], 'problem_id': problem['id']}
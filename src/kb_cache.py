@@ -0,0 +1,111 @@
+import time
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+from sqlalchemy import select
+from src.metrics import metrics
+from src.db_schema import (
+    get_db_session, Problem, SelfAssessment, Suggestion,
+    FeedbackPrompt, NextAction, FinetuningExample
+)
+
+# Tables that make up the knowledge base content. Feedback is deliberately
+# excluded: it changes on every submission and does not affect KB answers.
+KB_MODELS = [Problem, SelfAssessment, Suggestion, FeedbackPrompt, NextAction, FinetuningExample]
+
+
+def compute_kb_version(session) -> str:
+    """Hash the full content of the knowledge base tables.
+
+    The KB is small (tens of problems, hundreds of rows), so hashing every row
+    takes milliseconds and also catches in-place edits and full reloads that
+    keep row counts unchanged.
+    """
+    digest = hashlib.sha1()
+    for model in KB_MODELS:
+        table = model.__table__
+        digest.update(table.name.encode('utf-8'))
+        try:
+            rows = session.execute(select(table).order_by(*table.primary_key.columns)).all()
+        except Exception as e:
+            # A missing table is a valid (empty) state, e.g. before populate_db runs
+            print(f"Error reading {table.name} for KB version: {e}")
+            rows = []
+        for row in rows:
+            digest.update(repr(tuple(row)).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class KBCache:
+    """In-process snapshot of knowledge base query results, keyed by KB version.
+
+    The KB only changes when populate_db.py or the expanded-data update runs,
+    possibly from another process, so the version hash is recomputed at most
+    every ``check_interval`` seconds. When it changes, every cached value is
+    dropped and reloaded on next use. At most ``max_entries`` keys are held.
+    """
+
+    def __init__(self, check_interval: float = 5.0, max_entries: int = 256, session_scope: Callable = get_db_session):
+        self.check_interval = check_interval
+        self.max_entries = max_entries
+        self.session_scope = session_scope
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        self._checked_at = 0.0
+        self._values: Dict[str, Any] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _refresh_version_locked(self, force: bool = False) -> str:
+        now = time.monotonic()
+        if force or self._version is None or now - self._checked_at >= self.check_interval:
+            with metrics.timer("db_read_seconds", operation="kb_version"), self.session_scope() as session:
+                version = compute_kb_version(session)
+            self._checked_at = now
+            if version != self._version:
+                if self._version is not None:
+                    print(f"Knowledge base changed (version {self._version} -> {version}), dropping cached results")
+                    self.invalidations += 1
+                self._version = version
+                self._values.clear()
+        return self._version
+
+    def version(self) -> str:
+        """Return the current KB version hash"""
+        with self._lock:
+            return self._refresh_version_locked()
+
+    def get(self, key: str, loader: Callable[[], Any]) -> Tuple[Any, str]:
+        """Return (value, version) for key, loading it if the snapshot lacks it"""
+        with self._lock:
+            version = self._refresh_version_locked()
+            if key in self._values:
+                self.hits += 1
+                return self._values[key], version
+            self.misses += 1
+            # Loading under the lock keeps concurrent misses from all hitting the DB
+            value = loader()
+            # Keys can come from query parameters, so bound the snapshot size
+            if len(self._values) < self.max_entries:
+                self._values[key] = value
+            return value, version
+
+    def invalidate(self) -> None:
+        """Drop all cached values and force a version recheck"""
+        with self._lock:
+            self._values.clear()
+            self._refresh_version_locked(force=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'version': self._version,
+            'entries': len(self._values),
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations
+        }
+
+
+# Shared snapshot for the whole process; the API sets check_interval from its config
+kb_cache = KBCache()
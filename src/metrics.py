@@ -0,0 +1,147 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from src.tracing import record_timing
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        total, result = 0, []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class MetricsRegistry:
+    """Process-wide counters and latency histograms, rendered for Prometheus"""
+
+    def __init__(self, prefix: str = "ringan"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        """Record one latency observation"""
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            key = _label_key(labels)
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(seconds)
+
+    def increment(self, name: str, amount: float = 1, **labels) -> None:
+        """Add to a counter"""
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Time a block into a histogram and the request's Server-Timing, counting it as an error if it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.increment("errors_total", stage=name, **labels)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe(name, elapsed, **labels)
+            record_timing(name, elapsed)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return all metrics as plain data"""
+        with self._lock:
+            return {
+                'histograms': {
+                    name: [
+                        {'labels': dict(key), 'count': h.count, 'sum': h.sum}
+                        for key, h in series.items()
+                    ]
+                    for name, series in self._histograms.items()
+                },
+                'counters': {
+                    name: [{'labels': dict(key), 'value': value} for key, value in series.items()]
+                    for name, series in self._counters.items()
+                }
+            }
+
+    def render_prometheus(self, gauges: Optional[Dict[str, Dict[LabelKey, float]]] = None) -> str:
+        """Render counters, histograms and the given gauges in the text exposition format"""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                full = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {full} counter")
+                for key, value in series.items():
+                    lines.append(f"{full}{_format_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                full = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {full} histogram")
+                for key, h in series.items():
+                    for bound, count in h.cumulative():
+                        lines.append(f"{full}_bucket{_format_labels(key, ('le', str(bound)))} {count}")
+                    lines.append(f"{full}_bucket{_format_labels(key, ('le', '+Inf'))} {h.count}")
+                    lines.append(f"{full}_sum{_format_labels(key)} {h.sum}")
+                    lines.append(f"{full}_count{_format_labels(key)} {h.count}")
+        for name, series in sorted((gauges or {}).items()):
+            full = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {full} gauge")
+            for key, value in series.items():
+                lines.append(f"{full}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def stats_to_gauges(component: str, stats: Dict[str, Any]) -> Dict[str, Dict[LabelKey, float]]:
+    """Turn a component's stats() dict into gauges; nested dicts become a 'kind' label"""
+    gauges: Dict[str, Dict[LabelKey, float]] = {}
+    for key, value in stats.items():
+        if isinstance(value, bool) or value is None:
+            continue
+        if isinstance(value, (int, float)):
+            gauges.setdefault(f"{component}_{key}", {})[()] = value
+        elif isinstance(value, dict):
+            for kind, nested in value.items():
+                if isinstance(nested, (int, float)) and not isinstance(nested, bool):
+                    gauges.setdefault(f"{component}_{key}", {})[(('kind', str(kind)),)] = nested
+    return gauges
+
+
+# Shared registry for the whole process
+metrics = MetricsRegistry()
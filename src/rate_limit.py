@@ -0,0 +1,97 @@
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, NamedTuple, Tuple
+
+
+class RateLimitDecision(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    # Seconds until the bucket is full again
+    reset: int
+    # Seconds until the request would be allowed (0 when allowed)
+    retry_after: int
+
+    def headers(self) -> Dict[str, str]:
+        """Standard rate-limit response headers for this decision"""
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(self.reset)
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(self.retry_after)
+        return headers
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a client is over its rate limit; maps to 429 with rate-limit headers"""
+
+    def __init__(self, name: str, scope: str, decision: RateLimitDecision):
+        super().__init__(f"Rate limit exceeded for {name} ({scope})")
+        self.name = name
+        self.scope = scope
+        self.decision = decision
+
+
+class RateLimiter:
+    """Token-bucket rate limiter keyed by client (session ID, IP address, ...).
+
+    Each key gets a bucket of ``burst`` tokens refilled at ``rate_per_minute``.
+    At most ``max_keys`` buckets are kept; the least recently seen are dropped
+    first, which only forgets clients that have been quiet the longest. Must
+    be used from a single event loop.
+    """
+
+    def __init__(self, name: str, rate_per_minute: float, burst: int, max_keys: int = 10000):
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        # key -> (tokens, last_refill), ordered from least to most recently seen
+        self._buckets: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()
+        self.allowed = 0
+        self.limited = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0 and self.burst > 0
+
+    def check(self, key: Hashable, cost: float = 1.0, dry_run: bool = False) -> RateLimitDecision:
+        """Take ``cost`` tokens from the key's bucket if it has them.
+
+        With ``dry_run``, only report whether they are available, so several
+        buckets can be checked before any of them is charged.
+        """
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(key, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+
+        allowed = tokens >= cost
+        if not allowed:
+            self.limited += 1
+        elif not dry_run:
+            tokens -= cost
+            self.allowed += 1
+
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+        return RateLimitDecision(
+            allowed=allowed,
+            limit=self.burst,
+            remaining=int(tokens),
+            reset=math.ceil((self.burst - tokens) / self.rate),
+            retry_after=0 if allowed else math.ceil((cost - tokens) / self.rate)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'rate_per_minute': self.rate * 60.0,
+            'burst': self.burst,
+            'tracked_keys': len(self._buckets),
+            'allowed': self.allowed,
+            'limited': self.limited
+        }
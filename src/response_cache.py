@@ -0,0 +1,138 @@
+import json
+import hashlib
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from langchain_core.documents import Document
+from src.metrics import metrics
+from src.tracing import log
+from src.db_schema import ResponseCacheEntry
+
+# Last-used times are refreshed at most this often, so hits rarely write
+TOUCH_INTERVAL = timedelta(seconds=60)
+
+
+def response_cache_key(message: str, model_name: str, kb_version: str) -> str:
+    """Key an answer by normalized message, model and knowledge base version"""
+    return hashlib.sha256(f"{model_name}\x00{kb_version}\x00{message}".encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Persistent answer cache in the response_cache table.
+
+    Shared by all workers and kept across restarts. Entries older than
+    ``ttl_seconds`` are ignored and purged; when more than ``max_entries``
+    are stored, the least recently used are deleted. Because the KB version
+    is part of the key, answers from an older KB are simply never looked up
+    again and age out.
+    """
+
+    def __init__(self, session_factory: Callable, ttl_seconds: Optional[float] = 86400, max_entries: int = 10000):
+        self.session_factory = session_factory
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _expired_before(self) -> Optional[datetime]:
+        if self.ttl_seconds is None:
+            return None
+        return datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+
+    @staticmethod
+    def _encode(answer: str, documents: List[Document]) -> str:
+        return json.dumps({
+            'answer': answer,
+            'documents': [{'id': d.id, 'content': d.page_content, 'metadata': d.metadata} for d in documents]
+        }, ensure_ascii=False, separators=(',', ':'))
+
+    @staticmethod
+    def _decode(data: str) -> Tuple[str, List[Document]]:
+        value = json.loads(data)
+        documents = [Document(id=d['id'], page_content=d['content'], metadata=d['metadata']) for d in value['documents']]
+        return value['answer'], documents
+
+    def get(self, key: str) -> Optional[Tuple[str, List[Document]]]:
+        """Return (answer, documents) for a key, or None"""
+        session = self.session_factory()
+        try:
+            with metrics.timer("db_read_seconds", operation="response_cache_get"):
+                entry = session.get(ResponseCacheEntry, key)
+            cutoff = self._expired_before()
+            if entry is None or (cutoff is not None and entry.created_at < cutoff):
+                self.misses += 1
+                return None
+            now = datetime.utcnow()
+            if entry.last_used_at is None or now - entry.last_used_at > TOUCH_INTERVAL:
+                entry.last_used_at = now
+                entry.hits += 1
+                session.commit()
+            self.hits += 1
+            return self._decode(entry.response)
+        except Exception as e:
+            session.rollback()
+            self.errors += 1
+            log(f"Error reading response cache: {e}")
+            return None
+        finally:
+            session.close()
+
+    def set(self, key: str, answer: str, documents: List[Document], model_name: str, kb_version: str) -> None:
+        """Store an answer, then trim the cache back to its bounds"""
+        now = datetime.utcnow()
+        session = self.session_factory()
+        try:
+            with metrics.timer("db_write_seconds", operation="response_cache_set"):
+                session.merge(ResponseCacheEntry(
+                    cache_key=key,
+                    model_name=model_name,
+                    kb_version=kb_version,
+                    response=self._encode(answer, documents),
+                    hits=0,
+                    created_at=now,
+                    last_used_at=now
+                ))
+                self._trim(session)
+                session.commit()
+        except Exception as e:
+            session.rollback()
+            self.errors += 1
+            log(f"Error writing response cache: {e}")
+        finally:
+            session.close()
+
+    def _trim(self, session) -> None:
+        cutoff = self._expired_before()
+        if cutoff is not None:
+            self.evictions += session.query(ResponseCacheEntry).filter(ResponseCacheEntry.created_at < cutoff).delete()
+        excess = session.query(ResponseCacheEntry).count() - self.max_entries
+        if excess > 0:
+            oldest = session.query(ResponseCacheEntry.cache_key).order_by(ResponseCacheEntry.last_used_at).limit(excess)
+            self.evictions += session.query(ResponseCacheEntry).filter(
+                ResponseCacheEntry.cache_key.in_(oldest.scalar_subquery())
+            ).delete(synchronize_session=False)
+
+    def clear(self) -> None:
+        session = self.session_factory()
+        try:
+            session.query(ResponseCacheEntry).delete()
+            session.commit()
+        finally:
+            session.close()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'errors': self.errors
+        }
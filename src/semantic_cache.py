@@ -0,0 +1,110 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+
+class SemanticResponseCache:
+    """LRU cache of answers keyed by query embedding, matched by cosine similarity.
+
+    A lookup returns the answer of the most similar cached question if its
+    similarity is at least ``threshold`` and it is younger than
+    ``ttl_seconds``. Entries belong to a knowledge base version; the whole
+    cache is dropped as soon as a different version is seen. At most
+    ``max_entries`` answers are kept, least recently used evicted first.
+    """
+
+    def __init__(self, threshold: float = 0.92, ttl_seconds: Optional[float] = 3600, max_entries: int = 1000):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # key -> (unit embedding, value, stored_at), least to most recently used
+        self._entries: "OrderedDict[int, Tuple[np.ndarray, Any, float]]" = OrderedDict()
+        self._next_key = 0
+        # Stacked embeddings for vectorized lookups, rebuilt after changes
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[int] = []
+        self._version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.threshold <= 1.0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version_locked(self, version: str) -> None:
+        if version != self._version:
+            if self._version is not None and self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._matrix = None
+            self._version = version
+
+    def lookup(self, embedding: List[float], version: str) -> Optional[Any]:
+        """Return the cached value for the most similar question, or None"""
+        query = self._normalize(embedding)
+        with self._lock:
+            self._check_version_locked(version)
+            if self._entries and self._matrix is None:
+                self._matrix_keys = list(self._entries)
+                self._matrix = np.stack([self._entries[key][0] for key in self._matrix_keys])
+            if self._matrix is None:
+                self.misses += 1
+                return None
+
+            similarities = self._matrix @ query
+            best = int(np.argmax(similarities))
+            key = self._matrix_keys[best]
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            _, value, stored_at = self._entries[key]
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self._matrix = None
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def store(self, embedding: List[float], value: Any, version: str) -> None:
+        """Cache a value under a question embedding for the given KB version"""
+        with self._lock:
+            self._check_version_locked(version)
+            self._entries[self._next_key] = (self._normalize(embedding), value, time.monotonic())
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._matrix = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'threshold': self.threshold,
+            'ttl_seconds': self.ttl_seconds,
+            'kb_version': self._version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations
+        }
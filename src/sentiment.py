@@ -0,0 +1,63 @@
+import re
+from typing import Any, Dict
+
+# Small lexicon tuned for feedback on the assistant's answers
+POSITIVE_WORDS = {
+    'good', 'great', 'help', 'helpful', 'helped', 'helps', 'useful', 'thanks', 'thank', 'love', 'loved',
+    'liked', 'better', 'calmer', 'calm', 'relieved', 'nice', 'excellent', 'amazing',
+    'awesome', 'perfect', 'works', 'worked', 'clear', 'kind', 'supportive', 'appreciate',
+    'understood', 'comforting', 'encouraging', 'relevant', 'insightful', 'happy', 'glad'
+}
+NEGATIVE_WORDS = {
+    'bad', 'terrible', 'awful', 'useless', 'unhelpful', 'worse', 'worst', 'hate', 'hated',
+    'confusing', 'confused', 'wrong', 'irrelevant', 'generic', 'annoying', 'boring', 'rude',
+    'cold', 'robotic', 'repetitive', 'pointless', 'disappointing', 'disappointed', 'frustrating',
+    'frustrated', 'unclear', 'waste', 'dismissive', 'condescending'
+}
+NEGATIONS = {'not', 'no', 'never', 'nothing', 'hardly', 'barely', 'without'}
+# A negation flips the next sentiment word within this many tokens, in the same clause
+NEGATION_WINDOW = 3
+
+CLAUSE_PATTERN = re.compile(r"[.,;:!?]+")
+TOKEN_PATTERN = re.compile(r"[a-z']+")
+
+
+def estimate_sentiment(text: str) -> Dict[str, Any]:
+    """Cheap lexicon-based sentiment estimate, in the same shape as the LLM analysis.
+
+    Good enough for an instant reply; the authoritative score is computed
+    later by the LLM (see src/sentiment_scoring.py).
+    """
+    positive, negative, key_phrases = 0, 0, []
+    for clause in CLAUSE_PATTERN.split((text or '').lower()):
+        negate_until = -1
+        for index, token in enumerate(TOKEN_PATTERN.findall(clause)):
+            if token in NEGATIONS or token.endswith("n't"):
+                negate_until = index + NEGATION_WINDOW
+                continue
+            polarity = 1 if token in POSITIVE_WORDS else -1 if token in NEGATIVE_WORDS else 0
+            if not polarity:
+                continue
+            if index <= negate_until:
+                polarity = -polarity
+                negate_until = -1
+            if polarity > 0:
+                positive += 1
+            else:
+                negative += 1
+            key_phrases.append(token)
+
+    hits = positive + negative
+    if not hits:
+        return {'sentiment': 'neutral', 'confidence': 0.3, 'key_phrases': [], 'sentiment_score': 0.0}
+
+    # More matched words means more confidence in the direction
+    confidence = min(1.0, 0.5 + 0.1 * hits)
+    score = confidence * (positive - negative) / hits
+    sentiment = 'positive' if score > 0.3 else 'negative' if score < -0.3 else 'neutral'
+    return {
+        'sentiment': sentiment,
+        'confidence': confidence,
+        'key_phrases': key_phrases,
+        'sentiment_score': score
+    }
@@ -0,0 +1,172 @@
+import queue
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Set
+from src.metrics import metrics
+from src.feedback_rollups import update_feedback_sentiment
+from src.db_schema import Feedback, FeedbackScoringJob
+
+
+class SentimentScoringQueue:
+    """Background worker that replaces estimated feedback sentiment with the LLM score.
+
+    Feedback is stored with a local estimate and a row in feedback_scoring_jobs,
+    in the same transaction. submit() hands the ID to a worker thread, which
+    calls ``analyze`` and moves the feedback's contribution in the rollups to
+    the new score. The job table is the source of truth: when idle, the worker
+    sweeps it for jobs older than ``sweep_after`` seconds, which picks up work
+    lost to a full queue, a restart or another API worker going away. A job is
+    dropped after ``max_attempts`` failures, keeping the estimate.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable,
+        analyze: Callable[[str], Dict[str, Any]],
+        max_queue: int = 1000,
+        sweep_after: float = 60.0,
+        max_attempts: int = 5
+    ):
+        self.session_factory = session_factory
+        self.analyze = analyze
+        self.sweep_after = sweep_after
+        self.max_attempts = max_attempts
+        self._queue: "queue.Queue[str]" = queue.Queue(maxsize=max_queue)
+        self._queued: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.scored = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        """Start the worker thread if it is not running"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="sentiment-scoring", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 5.0) -> None:
+        """Stop the worker after its current job; unscored jobs stay in the table"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def submit(self, feedback_id: str) -> bool:
+        """Queue a feedback for scoring; returns False if it is left for the next sweep"""
+        self.start()
+        with self._lock:
+            if feedback_id in self._queued:
+                return True
+            try:
+                self._queue.put_nowait(feedback_id)
+            except queue.Full:
+                return False
+            self._queued.add(feedback_id)
+            return True
+
+    def _run(self) -> None:
+        # Pick up jobs left over from before this worker started
+        self._sweep()
+        while not self._stop.is_set():
+            try:
+                feedback_id = self._queue.get(timeout=self.sweep_after)
+            except queue.Empty:
+                self._sweep()
+                continue
+            with self._lock:
+                self._queued.discard(feedback_id)
+            try:
+                self._score(feedback_id)
+            except Exception as e:
+                print(f"Error scoring sentiment for feedback {feedback_id}: {e}")
+
+    def _sweep(self) -> None:
+        """Queue jobs that have waited longer than sweep_after"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.sweep_after)
+        session = self.session_factory()
+        try:
+            stale = session.query(FeedbackScoringJob.feedback_id).filter(
+                FeedbackScoringJob.created_at < cutoff
+            ).order_by(FeedbackScoringJob.created_at).limit(self._queue.maxsize).all()
+        except Exception as e:
+            print(f"Error sweeping feedback scoring jobs: {e}")
+            return
+        finally:
+            session.close()
+        for (feedback_id,) in stale:
+            if not self.submit(feedback_id):
+                break
+
+    def _score(self, feedback_id: str) -> None:
+        session = self.session_factory()
+        try:
+            feedback = session.get(Feedback, feedback_id)
+            if feedback is None:
+                session.query(FeedbackScoringJob).filter_by(feedback_id=feedback_id).delete()
+                session.commit()
+                return
+            text = feedback.user_feedback
+        finally:
+            session.close()
+
+        # The LLM call runs outside any transaction
+        result = self.analyze(text)
+
+        session = self.session_factory()
+        try:
+            with metrics.timer("db_write_seconds", operation="score_feedback"):
+                if result.get('error'):
+                    self._record_failure(session, feedback_id)
+                    return
+                # Claiming the job first takes the write lock, so a feedback
+                # scored by two workers only has its rollups moved once
+                if not session.query(FeedbackScoringJob).filter_by(feedback_id=feedback_id).delete():
+                    session.rollback()
+                    return
+                feedback = session.get(Feedback, feedback_id)
+                update_feedback_sentiment(session, feedback, result['sentiment_score'])
+                if result.get('key_phrases'):
+                    feedback.context = {**(feedback.context or {}), 'key_phrases': result['key_phrases']}
+                session.commit()
+            self.scored += 1
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _record_failure(self, session, feedback_id: str) -> None:
+        self.failed += 1
+        job = session.get(FeedbackScoringJob, feedback_id)
+        if job is None:
+            return
+        job.attempts += 1
+        if job.attempts >= self.max_attempts:
+            print(f"Giving up on scoring feedback {feedback_id} after {job.attempts} attempts, keeping the estimate")
+            session.delete(job)
+            self.dropped += 1
+        else:
+            # Push the job back so the next sweep retries it
+            job.created_at = datetime.utcnow()
+        session.commit()
+
+    def pending(self) -> int:
+        """Number of unscored jobs in the table"""
+        session = self.session_factory()
+        try:
+            return session.query(FeedbackScoringJob).count()
+        finally:
+            session.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'queue_depth': self._queue.qsize(),
+            'pending_jobs': self.pending(),
+            'scored': self.scored,
+            'failed': self.failed,
+            'dropped': self.dropped
+        }
@@ -0,0 +1,181 @@
+import sys
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+# Called as callback(key, value, reason) where reason is 'capacity', 'expired' or 'removed'
+EvictionCallback = Callable[[Hashable, Any, str], None]
+
+
+def approximate_size(obj: Any, _seen: Optional[set] = None) -> int:
+    """Approximate the number of bytes held by a value and its containers"""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approximate_size(k, _seen) + approximate_size(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(approximate_size(item, _seen) for item in obj)
+    return size
+
+
+class SessionStore:
+    """Bounded, thread-safe session map with LRU and idle-TTL eviction.
+
+    Entries are evicted when the store holds more than ``max_entries`` items
+    (least recently used first) or when they have not been accessed for
+    ``ttl_seconds``. Each entry carries an approximate byte size computed by
+    ``size_of`` so resident memory can be reported. Eviction callbacks run
+    outside the internal lock.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl_seconds: Optional[float] = 1800,
+        size_of: Callable[[Any], int] = approximate_size,
+        on_evict: Optional[EvictionCallback] = None
+    ):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.size_of = size_of
+        self._callbacks: List[EvictionCallback] = [on_evict] if on_evict else []
+
+        # key -> (value, last_access, size_bytes), ordered from least to most recently used
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float, int]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._resident_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = {'capacity': 0, 'expired': 0, 'removed': 0}
+
+    def add_eviction_callback(self, callback: EvictionCallback) -> None:
+        """Register a callback invoked for every entry leaving the store"""
+        self._callbacks.append(callback)
+
+    def _measure(self, value: Any) -> int:
+        try:
+            return int(self.size_of(value))
+        except Exception as e:
+            print(f"Error measuring session size: {e}")
+            return 0
+
+    def _is_expired(self, last_access: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - last_access > self.ttl_seconds
+
+    def _remove_locked(self, key: Hashable, reason: str, evicted: List[Tuple[Hashable, Any, str]]) -> None:
+        value, _, size = self._entries.pop(key)
+        self._resident_bytes -= size
+        self._evictions[reason] += 1
+        evicted.append((key, value, reason))
+
+    def _notify(self, evicted: List[Tuple[Hashable, Any, str]]) -> None:
+        for key, value, reason in evicted:
+            for callback in self._callbacks:
+                try:
+                    callback(key, value, reason)
+                except Exception as e:
+                    print(f"Error in session eviction callback for {key}: {e}")
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the value for a key and mark it as recently used"""
+        evicted: List[Tuple[Hashable, Any, str]] = []
+        with self._lock:
+            entry = self._entries.get(key)
+            now = time.monotonic()
+            if entry is not None and self._is_expired(entry[1], now):
+                self._remove_locked(key, 'expired', evicted)
+                entry = None
+            if entry is None:
+                self._misses += 1
+                result = default
+            else:
+                self._hits += 1
+                value, _, size = entry
+                self._entries[key] = (value, now, size)
+                self._entries.move_to_end(key)
+                result = value
+        self._notify(evicted)
+        return result
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Insert or replace a value, re-measuring its size"""
+        size = self._measure(value)
+        evicted: List[Tuple[Hashable, Any, str]] = []
+        with self._lock:
+            if key in self._entries:
+                self._resident_bytes -= self._entries[key][2]
+            self._entries[key] = (value, time.monotonic(), size)
+            self._entries.move_to_end(key)
+            self._resident_bytes += size
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove_locked(oldest, 'capacity', evicted)
+        self._notify(evicted)
+
+    def resize(self, key: Hashable) -> None:
+        """Re-measure an entry after its value was mutated in place"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            value, last_access, old_size = entry
+            size = self._measure(value)
+            self._entries[key] = (value, last_access, size)
+            self._resident_bytes += size - old_size
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove a key, firing eviction callbacks with reason 'removed'"""
+        evicted: List[Tuple[Hashable, Any, str]] = []
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._remove_locked(key, 'removed', evicted)
+        self._notify(evicted)
+        return evicted[0][1]
+
+    def purge_expired(self) -> int:
+        """Evict every idle entry past its TTL and return how many were removed"""
+        if self.ttl_seconds is None:
+            return 0
+        evicted: List[Tuple[Hashable, Any, str]] = []
+        with self._lock:
+            now = time.monotonic()
+            # Entries are in access order, so stop at the first live one
+            for key, (_, last_access, _) in list(self._entries.items()):
+                if not self._is_expired(last_access, now):
+                    break
+                self._remove_locked(key, 'expired', evicted)
+        self._notify(evicted)
+        return len(evicted)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not self._is_expired(entry[1], time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return counters suitable for scraping"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'resident_bytes': self._resident_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'evictions': dict(self._evictions),
+                'evictions_total': sum(self._evictions.values())
+            }
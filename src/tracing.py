@@ -0,0 +1,109 @@
+import re
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+# Trace ID of the request being handled, propagated to worker threads by
+# asyncio.to_thread and FastAPI's threadpool
+trace_id_var: ContextVar[Optional[str]] = ContextVar("trace_id", default=None)
+# Time spent per Server-Timing category (milliseconds) in the current request
+timings_var: ContextVar[Optional[Dict[str, float]]] = ContextVar("server_timings", default=None)
+
+TRACE_HEADER = "X-Trace-ID"
+VALID_TRACE_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# Server-Timing category for each latency metric
+TIMING_CATEGORIES = {
+    'db_read_seconds': 'db',
+    'db_write_seconds': 'db',
+    'rag_embedding_seconds': 'retrieval',
+    'rag_vector_search_seconds': 'retrieval',
+    'rag_keyword_search_seconds': 'retrieval',
+    'rag_keyword_index_seconds': 'retrieval',
+    'rag_document_fetch_seconds': 'retrieval',
+    'rag_condense_seconds': 'llm',
+    'rag_qa_llm_seconds': 'llm',
+    'rag_summary_seconds': 'llm',
+    'sentiment_analysis_seconds': 'llm',
+    'response_serialization_seconds': 'serialize'
+}
+
+
+def current_trace_id() -> Optional[str]:
+    return trace_id_var.get()
+
+
+def record_timing(metric: str, seconds: float) -> None:
+    """Add a timed block to the current request's Server-Timing breakdown"""
+    timings = timings_var.get()
+    if timings is None:
+        return
+    category = TIMING_CATEGORIES.get(metric, metric.replace('_seconds', ''))
+    timings[category] = timings.get(category, 0.0) + seconds * 1000
+
+
+def reset_timings() -> None:
+    """Start a fresh Server-Timing breakdown, e.g. per turn on a long-lived WebSocket"""
+    timings_var.set({})
+
+
+def current_timings() -> Dict[str, float]:
+    """Milliseconds per category recorded so far in this request"""
+    return {category: round(ms, 1) for category, ms in (timings_var.get() or {}).items()}
+
+
+def format_server_timing(timings: Dict[str, float], total_ms: float) -> str:
+    parts = [f"{category};dur={ms:.1f}" for category, ms in sorted(timings.items())]
+    parts.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(parts)
+
+
+def log(message: str) -> None:
+    """Print a log line tagged with the current trace ID"""
+    trace_id = trace_id_var.get()
+    print(f"[trace={trace_id}] {message}" if trace_id else message)
+
+
+class TracingMiddleware:
+    """Give each request a trace ID and report where its time went.
+
+    The trace ID is taken from an incoming X-Trace-ID header when valid and
+    generated otherwise. HTTP responses carry it back in X-Trace-ID, along with a
+    Server-Timing header summing the DB, retrieval, LLM and serialization
+    time recorded up to the moment the response headers are sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        incoming = None
+        for name, value in scope.get("headers", []):
+            if name == TRACE_HEADER.lower().encode():
+                incoming = value.decode("latin-1")
+                break
+        trace_id = incoming if incoming and VALID_TRACE_ID.match(incoming) else uuid.uuid4().hex[:16]
+        trace_token = trace_id_var.set(trace_id)
+        timings: Dict[str, float] = {}
+        timings_token = timings_var.set(timings)
+        started = time.perf_counter()
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                total_ms = (time.perf_counter() - started) * 1000
+                headers = list(message.get("headers", []))
+                headers.append((TRACE_HEADER.lower().encode(), trace_id.encode()))
+                headers.append((b"server-timing", format_server_timing(timings, total_ms).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers if scope["type"] == "http" else send)
+        finally:
+            trace_id_var.reset(trace_token)
+            timings_var.reset(timings_token)
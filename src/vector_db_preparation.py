@@ -1,11 +1,12 @@
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import os
 import json
 from .data_preprocessing import DataPreprocessor
 from langchain.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
+from .embedding_cache import cached_huggingface_embeddings
 
 class VectorDBPreparation:
     def __init__(self, knowledge_base: Dict[str, pd.DataFrame]):
@@ -93,10 +94,12 @@ class VectorDBPreparation:
 
         return documents
 
-    def save_for_vector_db(self, documents: List[Dict[str, Any]], output_path: str):
+    def save_for_vector_db(self, documents: List[Dict[str, Any]], output_path: str, embeddings: Optional[Embeddings] = None):
         """Save documents with embeddings to a proper vector database"""
-        # Initialize HuggingFace embeddings
-        embeddings = HuggingFaceEmbeddings(model_name='all-MiniLM-L6-v2')
+        # HuggingFace embeddings behind the cache shared with the API, so
+        # unchanged documents are not re-encoded on a rebuild
+        if embeddings is None:
+            embeddings = cached_huggingface_embeddings()
         
         # Extract texts and metadatas
         texts = [doc['text'] for doc in documents]